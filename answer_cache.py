@@ -0,0 +1,121 @@
+# answer_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+# Minimum cosine similarity between query embeddings to reuse an answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+
+_ANSWER_CACHE = None
+_ANSWER_CACHE_LOCK = threading.Lock()
+
+
+class CachedAnswer(NamedTuple):
+    query: str
+    answer: str
+    sources: list
+    created: float
+    similarity: float = 1.0
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    Answers to earlier questions, keyed by knowledge-base version and query
+    embedding.
+
+    A lookup returns the closest cached answer for the same version if its
+    query is at least `threshold` cosine-similar, so repeated and
+    near-duplicate questions skip retrieval and the LLM. Entries expire after
+    `ttl_seconds`, and the least recently used go first when the cache is full.
+    Changing the knowledge base changes its version, so stale answers are
+    never served.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+        # entry id -> (version, unit query vector, CachedAnswer), in LRU order
+        self._entries = OrderedDict()
+        self._next_id = 0
+
+    def lookup(self, version: str, query_vector):
+        """Best cached answer for this version within the threshold, or None."""
+        query = _unit(query_vector)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            self._expire(now)
+
+            candidates = [
+                (entry_id, vector, entry)
+                for entry_id, (entry_version, vector, entry) in self._entries.items()
+                if entry_version == version
+            ]
+            if not candidates:
+                return None
+            similarities = np.stack([vector for _, vector, _ in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id, _, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry._replace(similarity=float(similarities[best]))
+
+    def store(self, version: str, query: str, query_vector, answer: str, sources):
+        """Cache a completed answer; empty ones (e.g. an empty stream) are not kept."""
+        if not answer or not answer.strip():
+            return
+        with self._lock:
+            self._entries[self._next_id] = (
+                version,
+                _unit(query_vector),
+                CachedAnswer(query, answer, list(sources), time.time()),
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "lookups": self.lookups,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            }
+
+    def _expire(self, now: float):
+        expired = [
+            entry_id for entry_id, (_, _, entry) in self._entries.items()
+            if now - entry.created > self.ttl_seconds
+        ]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """The process-wide answer cache shared by all sessions."""
+    global _ANSWER_CACHE
+    with _ANSWER_CACHE_LOCK:
+        if _ANSWER_CACHE is None:
+            _ANSWER_CACHE = SemanticAnswerCache()
+        return _ANSWER_CACHE
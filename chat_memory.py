@@ -0,0 +1,162 @@
+# chat_memory.py
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_classic.chains.llm import LLMChain
+from langchain_classic.memory import ConversationSummaryBufferMemory
+from langchain_classic.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from context_packer import get_token_counter
+
+# Token budget for replayed chat history (summary + recent turns)
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1000"))
+
+# Summarization of old turns runs here, off the request path
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+class BackgroundSummaryMemory(ConversationSummaryBufferMemory):
+    """
+    Token-budgeted chat memory that summarizes older turns in the background.
+
+    New turns are appended immediately. Once the history exceeds
+    max_token_limit, the oldest messages are folded into the running summary
+    by a background worker, so a turn never waits for the summarization LLM
+    call. Until that finishes, load_memory_variables() keeps only the newest
+    messages that fit in the budget, so replayed history never exceeds it.
+
+    Tokens are counted locally (see context_packer.get_token_counter), once
+    per message, and the counts are kept alongside the messages.
+    """
+
+    max_token_limit: int = MEMORY_MAX_TOKENS
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _summarizing: bool = PrivateAttr(default=False)
+    # Token count of each message in chat_memory.messages, in the same order
+    _token_counts: list = PrivateAttr(default_factory=list)
+    # Bumped by clear(), so a summary of the old history is discarded rather than applied
+    _generation: int = PrivateAttr(default=0)
+
+    def save_context(self, inputs, outputs) -> None:
+        # Append only; pruning happens in the background
+        with self._lock:
+            BaseChatMemory.save_context(self, inputs, outputs)
+        self._schedule_summary()
+
+    async def asave_context(self, inputs, outputs) -> None:
+        self.save_context(inputs, outputs)
+
+    def _count_tokens(self, text: str) -> int:
+        return get_token_counter(getattr(self.llm, "model_name", None))(text)
+
+    def _snapshot(self):
+        """Messages, their token counts, summary and generation; call with the lock held."""
+        messages = list(self.chat_memory.messages)
+        for message in messages[len(self._token_counts):]:
+            self._token_counts.append(self._count_tokens(
+                get_buffer_string([message], human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+            ))
+        return messages, list(self._token_counts), self.moving_summary_buffer, self._generation
+
+    def load_memory_variables(self, inputs) -> dict:
+        with self._lock:
+            messages, counts, summary, _ = self._snapshot()
+
+        # Hard cap: drop the oldest messages still waiting to be summarized
+        budget = self.max_token_limit
+        if summary:
+            budget -= self._count_tokens(summary)
+        total = sum(counts)
+        dropped = 0
+        while dropped < len(messages) and total > budget:
+            total -= counts[dropped]
+            dropped += 1
+        messages = messages[dropped:]
+
+        if summary:
+            messages = [SystemMessage(content=summary)] + messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {
+            self.memory_key: get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._token_counts = []
+            self._generation += 1
+
+    def _schedule_summary(self):
+        with self._lock:
+            if self._summarizing:
+                # The running job re-checks the budget when it finishes
+                return
+            self._summarizing = True
+        _SUMMARY_EXECUTOR.submit(self._summarize_overflow)
+
+    def _summarize_overflow(self):
+        try:
+            while True:
+                with self._lock:
+                    messages, counts, summary, generation = self._snapshot()
+                total = sum(counts)
+                overflow = 0
+                while overflow < len(messages) and total > self.max_token_limit:
+                    total -= counts[overflow]
+                    overflow += 1
+                if not overflow:
+                    return
+
+                new_summary = self.predict_new_summary(messages[:overflow], summary)
+                with self._lock:
+                    if generation != self._generation:
+                        # Cleared meanwhile: the summary is of a conversation that no longer exists
+                        continue
+                    # New turns may have been appended meanwhile; drop only what was summarized
+                    del self.chat_memory.messages[:overflow]
+                    del self._token_counts[:overflow]
+                    self.moving_summary_buffer = new_summary
+        except Exception as e:
+            print(f"Background memory summarization failed: {e}")
+        finally:
+            with self._lock:
+                self._summarizing = False
+
+
+class CachedLLMChain(LLMChain):
+    """
+    LLMChain that memoizes its output by input values. Used as the
+    question generator of ConversationalRetrievalChain so a condensed
+    standalone question is not regenerated for the same question and history.
+    """
+
+    cache_size: int = 256
+
+    _cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _cache_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _call(self, inputs, run_manager=None):
+        key = json.dumps({name: inputs[name] for name in self.input_keys}, sort_keys=True, default=str)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        outputs = super()._call(inputs, run_manager=run_manager)
+        if not str(outputs.get(self.output_key, "")).strip():
+            # An empty question would be replayed for every later call with these inputs
+            return outputs
+        with self._cache_lock:
+            self._cache[key] = outputs
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return outputs
@@ -0,0 +1,155 @@
+# context_packer.py
+import functools
+import os
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Pack retrieved chunks into a token budget instead of passing a fixed k (set CONTEXT_PACKING=0 to disable)
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "1") != "0"
+# Token budget for the retrieved context in the prompt
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# Candidate chunks retrieved per question; packing keeps as many as fit the budget
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "8"))
+# Hugging Face tokenizer of the served LLM (repo id or local path), read from the local cache only
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "")
+
+# Shortest suffix/prefix match treated as splitter overlap rather than coincidence
+_MIN_OVERLAP_CHARS = 20
+
+
+def _hf_token_counter(name: str):
+    """Token counter from a Hugging Face tokenizer in the local cache, or None if there isn't one."""
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
+    except Exception:
+        return None
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+@functools.lru_cache(maxsize=16)
+def get_token_counter(model_name: str = None):
+    """
+    A text -> token count function for the target model, preferring the
+    model's own tokenizer: the CONTEXT_TOKENIZER Hugging Face tokenizer,
+    then one cached locally under model_name itself (e.g. when the server
+    serves a Hugging Face repo id), then tiktoken's encoding if tiktoken
+    knows model_name. Only then does it approximate, with cl100k_base or
+    ~4 characters per token.
+    """
+    if CONTEXT_TOKENIZER:
+        counter = _hf_token_counter(CONTEXT_TOKENIZER)
+        if counter is not None:
+            return counter
+        print(f"Could not load tokenizer '{CONTEXT_TOKENIZER}' from the local cache, falling back.")
+    if model_name:
+        counter = _hf_token_counter(model_name)
+        if counter is not None:
+            return counter
+    try:
+        import tiktoken
+    except ImportError:
+        tiktoken = None
+    if tiktoken is not None and model_name:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    print(
+        f"No tokenizer found for '{model_name}'; token budgets are approximate. "
+        "Set CONTEXT_TOKENIZER to the served model's Hugging Face tokenizer."
+    )
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.get_encoding("cl100k_base")
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            # Encoding files unavailable offline
+            pass
+    return lambda text: (len(text) + 3) // 4
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 if too short to count)."""
+    for size in range(min(len(first), len(second)), _MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def _merge(first: str, second: str):
+    """
+    Combine two chunks of the same source if they are duplicates, one
+    contains the other, or they overlap end-to-start (either way round).
+    Returns the merged text, or None if they are unrelated.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    size = _overlap(first, second)
+    if size:
+        return first + second[size:]
+    size = _overlap(second, first)
+    if size:
+        return second + first[size:]
+    return None
+
+
+def pack_context(documents, max_tokens: int = CONTEXT_MAX_TOKENS, count_tokens=None) -> list:
+    """
+    Assemble retrieved chunks (best first) into at most max_tokens of context.
+
+    Chunks of the same source that duplicate, contain or overlap each other
+    (neighbours share the splitter's chunk_overlap) are merged into one
+    passage, so shared text is sent once. Passages are then taken in rank
+    order, skipping any that no longer fit the budget. If even the best
+    passage is over budget, it is truncated to fit.
+    """
+    count_tokens = count_tokens or get_token_counter()
+
+    # Merge within each source; a passage keeps the rank of its best chunk
+    passages = []  # [rank, source, text, metadata]
+    for rank, doc in enumerate(documents):
+        source = doc.metadata.get("source")
+        text = doc.page_content
+        for passage in passages:
+            if passage[1] != source:
+                continue
+            merged = _merge(passage[2], text)
+            if merged is not None:
+                passage[2] = merged
+                break
+        else:
+            passages.append([rank, source, text, dict(doc.metadata)])
+
+    packed = []
+    used = 0
+    for _, _, text, metadata in sorted(passages, key=lambda passage: passage[0]):
+        tokens = count_tokens(text)
+        if used + tokens <= max_tokens:
+            packed.append(Document(page_content=text, metadata=metadata))
+            used += tokens
+    if not packed and passages:
+        # Nothing fits whole: cut the best passage down to the budget
+        _, _, text, metadata = min(passages, key=lambda passage: passage[0])
+        while text and count_tokens(text) > max_tokens:
+            text = text[:int(len(text) * max_tokens / count_tokens(text) * 0.95)]
+        packed.append(Document(page_content=text, metadata=metadata))
+    return packed
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """Wraps a retriever so its results are deduplicated, merged and packed into a token budget."""
+
+    base_retriever: BaseRetriever
+    max_tokens: int = CONTEXT_MAX_TOKENS
+    model_name: str = ""
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        documents = self.base_retriever.invoke(query)
+        return pack_context(documents, self.max_tokens, get_token_counter(self.model_name or None))
@@ -0,0 +1,185 @@
+# embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+# Disk cache location and size bound (can be overridden by environment variables)
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR", os.path.expanduser("~/.cache/chatrag/embeddings")
+)
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# Recent query vectors kept in memory (the answer cache and retriever embed the same query)
+QUERY_CACHE_SIZE = 256
+
+
+def _cache_key(model_id: str, text: str) -> str:
+    """Content address of a chunk: hash of the model id and the chunk text."""
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Disk-backed, content-addressed cache in front of an embedding model.
+
+    Document vectors are stored in SQLite keyed by (model id, chunk text hash),
+    so re-ingesting a chunk that was embedded before costs a lookup instead of
+    an encoder pass. The cache is bounded by size and evicts least recently
+    used vectors first. Query vectors are only kept in a small in-memory LRU.
+    """
+
+    def __init__(self, underlying: Embeddings, model_id: str,
+                 cache_dir: str = EMBEDDING_CACHE_DIR,
+                 max_mb: float = EMBEDDING_CACHE_MAX_MB):
+        self.underlying = underlying
+        self.model_id = model_id
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        # Encoder throughput: chunks actually encoded and the time spent on them
+        self.encoded = 0
+        self.encode_seconds = 0.0
+        self._lock = threading.Lock()
+        self._query_cache = OrderedDict()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "embeddings.sqlite3")
+        # Streamlit serves sessions from several threads; all access goes through self._lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    # --- Embeddings interface ---
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts, encoding only those not already in the cache."""
+        keys = [_cache_key(self.model_id, text) for text in texts]
+        vectors = self._lookup(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in vectors]
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # Duplicate chunks within one batch are encoded once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            start = time.perf_counter()
+            new_vectors = self.underlying.embed_documents(list(unique.values()))
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.encoded += len(unique)
+                self.encode_seconds += elapsed
+            computed = dict(zip(unique.keys(), new_vectors))
+            self._store(computed)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                return vector
+        vector = self.underlying.embed_query(text)
+        with self._lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    # --- Cache management ---
+
+    def stats(self) -> dict:
+        """Hit/miss and throughput counters for this process plus current on-disk size."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "encoded": self.encoded,
+                "chunks_per_sec": self.encoded / self.encode_seconds if self.encode_seconds else 0.0,
+                "entries": entries,
+                "size_mb": size / (1024 * 1024),
+            }
+
+    def clear(self):
+        """Drop every cached vector."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def _lookup(self, keys: list[str]) -> dict:
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Stay under SQLite's host parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows],
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, vectors: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete least recently used vectors until the cache fits in max_bytes."""
+        (size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        if size <= self.max_bytes:
+            return
+        excess = size - self.max_bytes
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"
+        )
+        stale = []
+        for key, length in rows:
+            stale.append((key,))
+            excess -= length
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
@@ -0,0 +1,86 @@
+# http_client.py
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections kept open per host, shared by every session and request
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+# How long a /v1/models listing is reused before the endpoint is asked again
+MODEL_LIST_TTL_SECONDS = float(os.getenv("MODEL_LIST_TTL_SECONDS", "60"))
+
+_SESSION = None
+_HTTPX_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+# (models url, api key) -> (fetched at, model ids)
+_MODEL_LISTS = {}
+_MODEL_LISTS_LOCK = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    The process-wide requests session. Its connection pool keeps TCP/TLS
+    connections to each endpoint alive across users and requests.
+    """
+    global _SESSION
+    with _CLIENT_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSION = session
+        return _SESSION
+
+
+def get_httpx_client():
+    """
+    The process-wide httpx client, passed to OpenAI clients so completions
+    share one keep-alive pool instead of each client opening its own.
+    """
+    global _HTTPX_CLIENT
+    with _CLIENT_LOCK:
+        if _HTTPX_CLIENT is None:
+            import httpx  # installed with the openai package
+
+            _HTTPX_CLIENT = httpx.Client(
+                timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                ),
+            )
+        return _HTTPX_CLIENT
+
+
+def models_url(api_base: str) -> str:
+    return api_base.replace("/v1", "") + "/v1/models"
+
+
+def list_models(api_base: str, api_key: str = None, refresh: bool = False) -> list[str]:
+    """
+    Model ids served by an OpenAI-compatible endpoint, cached per endpoint
+    for MODEL_LIST_TTL_SECONDS. Raises requests exceptions on failure;
+    failures are not cached.
+    """
+    url = models_url(api_base)
+    key = (url, api_key)
+    now = time.time()
+    if not refresh:
+        with _MODEL_LISTS_LOCK:
+            cached = _MODEL_LISTS.get(key)
+        if cached is not None and now - cached[0] < MODEL_LIST_TTL_SECONDS:
+            return cached[1]
+
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    response = get_session().get(url, headers=headers, timeout=10)
+    response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+    model_ids = [model.get("id") for model in response.json().get("data", [])]
+
+    with _MODEL_LISTS_LOCK:
+        _MODEL_LISTS[key] = (now, model_ids)
+    return model_ids
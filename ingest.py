@@ -0,0 +1,252 @@
+# ingest.py
+import csv
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+from langchain_community.document_loaders import (
+    CSVLoader,
+    Docx2txtLoader,
+    PyMuPDFLoader,
+    PyPDFLoader,
+    TextLoader,
+    UnstructuredExcelLoader,
+)
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from knowledge_base import CHUNK_OVERLAP, CHUNK_SIZE
+
+# Worker processes for parsing/chunking (default: one per core)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".csv", ".xls", ".xlsx")
+
+# Long-lived pool so worker start-up (and their imports) is paid once per process
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+class IngestedFile(NamedTuple):
+    """Result of parsing and chunking one file."""
+    source: str
+    chunks: list
+    documents: Optional[list]
+    parse_seconds: float
+    split_seconds: float
+    error: Optional[str] = None
+
+
+def _get_loader(path: str):
+    file_ext = os.path.splitext(path)[1].lower()
+
+    if file_ext == ".pdf":
+        try:
+            import fitz  # noqa: F401 - PyMuPDF is much faster than pypdf when available
+            return PyMuPDFLoader(path)
+        except ImportError:
+            return PyPDFLoader(path)
+    elif file_ext == ".docx":
+        return Docx2txtLoader(path)
+    elif file_ext == ".txt":
+        return TextLoader(path, autodetect_encoding=True)
+    elif file_ext == ".csv":
+        return CSVLoader(path)
+    elif file_ext in [".xls", ".xlsx"]:
+        return UnstructuredExcelLoader(path)
+    raise ValueError(f"Unsupported file type: {file_ext}")
+
+
+def load_file(path: str, source: str = None) -> list:
+    """Parse one file into documents tagged with its source filename."""
+    documents = _get_loader(path).load()
+    for doc in documents:
+        doc.metadata["source"] = source or os.path.basename(path)
+    return documents
+
+
+def _decode_text(data: bytes) -> str:
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(data).best()
+        if best is not None:
+            return str(best)
+    except ImportError:
+        pass
+    return data.decode("latin-1")
+
+
+def _load_pdf_bytes(data: bytes, source: str) -> list:
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
+
+    if fitz is not None:
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            return [
+                Document(page_content=page.get_text(), metadata={"source": source, "page": i})
+                for i, page in enumerate(pdf)
+            ]
+
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(data))
+    return [
+        Document(page_content=page.extract_text() or "", metadata={"source": source, "page": i})
+        for i, page in enumerate(reader.pages)
+    ]
+
+
+def _load_csv_bytes(data: bytes, source: str) -> list:
+    # Same row format as CSVLoader
+    reader = csv.DictReader(io.StringIO(_decode_text(data)))
+    return [
+        Document(
+            page_content="\n".join(f"{key.strip()}: {(value or '').strip()}" for key, value in row.items() if key),
+            metadata={"source": source, "row": i},
+        )
+        for i, row in enumerate(reader)
+    ]
+
+
+def load_bytes(data, source: str) -> list:
+    """
+    Parse an in-memory file (bytes or memoryview) into documents without
+    writing it to disk. The file type comes from source's extension.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    file_ext = os.path.splitext(source)[1].lower()
+
+    if file_ext == ".pdf":
+        return _load_pdf_bytes(data, source)
+    elif file_ext == ".docx":
+        import docx2txt
+        return [Document(page_content=docx2txt.process(io.BytesIO(data)), metadata={"source": source})]
+    elif file_ext == ".txt":
+        return [Document(page_content=_decode_text(data), metadata={"source": source})]
+    elif file_ext == ".csv":
+        return _load_csv_bytes(data, source)
+    elif file_ext in [".xls", ".xlsx"]:
+        # Unstructured's Excel loader needs a path
+        with tempfile.NamedTemporaryFile(suffix=file_ext) as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            return load_file(tmp_file.name, source)
+    raise ValueError(f"Unsupported file type: {file_ext}")
+
+
+def parse_and_split(item, source: str = None, chunk_size=CHUNK_SIZE,
+                    chunk_overlap=CHUNK_OVERLAP, keep_documents=False) -> IngestedFile:
+    """
+    Parse and chunk one file, given as a path or as in-memory bytes.
+    Runs inside a worker process.
+    """
+    in_memory = isinstance(item, (bytes, bytearray, memoryview))
+    if in_memory and not source:
+        raise ValueError("source (the filename) is required for in-memory files")
+    source = source or os.path.basename(item)
+    try:
+        start = time.perf_counter()
+        documents = load_bytes(item, source) if in_memory else load_file(item, source)
+        parsed = time.perf_counter()
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks = text_splitter.split_documents(documents)
+        split = time.perf_counter()
+    except Exception as e:
+        return IngestedFile(source, [], None, 0.0, 0.0, error=f"{type(e).__name__}: {e}")
+    return IngestedFile(
+        source,
+        chunks,
+        documents if keep_documents else None,
+        parsed - start,
+        split - parsed,
+    )
+
+
+def _get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # spawn, not fork: the parent runs Streamlit/torch threads that must not be forked
+            _POOL = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _POOL
+
+
+def _discard_pool(pool):
+    """Shut down a broken pool so the next _get_pool() starts fresh workers."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_all(pool, items, sources, chunk_size, chunk_overlap, keep_documents) -> dict:
+    """Submits one parse_and_split per file; returns {future: source}."""
+    return {
+        # memoryviews can't be pickled; bytes cross the pipe as-is
+        pool.submit(
+            parse_and_split,
+            item.tobytes() if isinstance(item, memoryview) else item,
+            source, chunk_size, chunk_overlap, keep_documents,
+        ): source
+        for item, source in zip(items, sources)
+    }
+
+
+def ingest_files(items, sources=None, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                 keep_documents=False):
+    """
+    Parse and chunk files concurrently, yielding an IngestedFile per file as
+    soon as it is ready (completion order, not input order).
+
+    items are paths or in-memory file contents; for in-memory files, sources
+    must give the filenames. Buffers go to the workers over a pipe, so
+    uploads never round-trip through a temp file.
+
+    PDF parsing is CPU-bound, so files are spread over a process pool; the
+    caller can embed one file's chunks while the others are still parsing.
+    A single file is handled inline to skip the inter-process round-trip.
+    Failures are reported per file through IngestedFile.error, including a
+    worker process dying mid-file; the pool is then replaced for later calls.
+    """
+    items = list(items)
+    sources = list(sources) if sources is not None else [os.path.basename(item) for item in items]
+
+    if len(items) <= 1 or INGEST_WORKERS <= 1:
+        for item, source in zip(items, sources):
+            yield parse_and_split(item, source, chunk_size, chunk_overlap, keep_documents)
+        return
+
+    pool = _get_pool()
+    try:
+        futures = _submit_all(pool, items, sources, chunk_size, chunk_overlap, keep_documents)
+    except BrokenProcessPool:
+        # A worker died during an earlier call after its results were collected
+        _discard_pool(pool)
+        pool = _get_pool()
+        futures = _submit_all(pool, items, sources, chunk_size, chunk_overlap, keep_documents)
+
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            # The worker crashed (e.g. a parser segfault or OOM kill) or the result didn't unpickle
+            if isinstance(e, BrokenProcessPool):
+                _discard_pool(pool)
+            result = IngestedFile(futures[future], [], None, 0.0, 0.0, error=f"{type(e).__name__}: {e}")
+        yield result
@@ -0,0 +1,639 @@
+# knowledge_base.py
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import re
+import secrets
+import shutil
+import threading
+import time
+import uuid
+
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+import vector_index
+from sparse_index import HYBRID_FETCH_K, HYBRID_SEARCH, BM25Index, HybridRetriever
+
+# Chunking defaults shared by the Streamlit app and the RAG chain
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Chunks passed to the prompt per question
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+
+# Minimum cosine similarity for retrieved chunks (only used with normalized embeddings; 0 = off)
+RETRIEVAL_SCORE_THRESHOLD = float(os.getenv("RETRIEVAL_SCORE_THRESHOLD", "0"))
+
+# Root directory of named, on-disk knowledge bases
+KNOWLEDGE_BASE_DIR = os.getenv(
+    "KNOWLEDGE_BASE_DIR", os.path.expanduser("~/.cache/chatrag/knowledge_bases")
+)
+
+# Secret that signs saved pickles, so load() only unpickles files written by this installation
+KNOWLEDGE_BASE_KEY_FILE = os.getenv(
+    "KNOWLEDGE_BASE_KEY_FILE", os.path.expanduser("~/.cache/chatrag/knowledge_base.key")
+)
+# Also load knowledge bases without a valid signature (saved before signing, or copied from
+# elsewhere). Unpickling runs code, so only enable this for directories you trust
+KNOWLEDGE_BASE_ALLOW_UNSIGNED = os.getenv("KNOWLEDGE_BASE_ALLOW_UNSIGNED", "0") == "1"
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.pkl"
+SPARSE_FILE = "sparse.pkl"
+MANIFEST_FILE = "manifest.json"
+# Each save writes its index files to a new subdirectory here; the manifest points at the current one
+VERSIONS_DIR = "versions"
+
+# Serializes saves within this process; the manifest version check catches other processes
+_SAVE_LOCK = threading.Lock()
+
+# Open knowledge bases shared by every session and request in this process: name -> (KnowledgeBase, lock)
+_OPEN_KNOWLEDGE_BASES = {}
+# name -> lock held while that knowledge base loads, so a slow load doesn't hold up opening others
+_LOAD_LOCKS = {}
+_OPEN_KNOWLEDGE_BASES_LOCK = threading.Lock()
+
+
+class StaleKnowledgeBaseError(RuntimeError):
+    """Raised when saving over a knowledge base that another writer saved since it was loaded."""
+
+
+def file_hash(data: bytes) -> str:
+    """Content hash used to tell whether an uploaded file changed."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def knowledge_base_path(name: str) -> str:
+    """Directory holding the named knowledge base."""
+    if not re.fullmatch(r"[A-Za-z0-9_.-]+", name) or name.startswith("."):
+        raise ValueError(
+            f"Invalid knowledge base name '{name}'. "
+            "Use letters, digits, '-', '_' and '.' only."
+        )
+    return os.path.join(KNOWLEDGE_BASE_DIR, name)
+
+
+def list_knowledge_bases() -> list[str]:
+    """Names of all knowledge bases saved on disk."""
+    if not os.path.isdir(KNOWLEDGE_BASE_DIR):
+        return []
+    return sorted(
+        entry for entry in os.listdir(KNOWLEDGE_BASE_DIR)
+        if os.path.exists(os.path.join(KNOWLEDGE_BASE_DIR, entry, MANIFEST_FILE))
+    )
+
+
+def read_manifest(directory: str):
+    """Load a manifest.json from directory, or None if there is none."""
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def data_directory(directory: str, manifest: dict) -> str:
+    """Directory holding the index files of the version the manifest points at."""
+    # Knowledge bases saved before versioned saves keep their files next to the manifest
+    return os.path.join(directory, manifest["data_dir"]) if manifest.get("data_dir") else directory
+
+
+def write_manifest(directory: str, manifest: dict):
+    _atomic_write(
+        os.path.join(directory, MANIFEST_FILE),
+        lambda path: _write_json(path, manifest),
+    )
+
+
+def _write_json(path: str, data: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def _atomic_write(path: str, write):
+    """
+    Write a file via a temp file and rename, so readers see either the old
+    or the new file, never a partial one.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _prune_versions(directory: str, keep):
+    """Delete saved versions other than those in keep (data_dir values; None for the legacy layout)."""
+    versions = os.path.join(directory, VERSIONS_DIR)
+    if os.path.isdir(versions):
+        for entry in os.listdir(versions):
+            if os.path.join(VERSIONS_DIR, entry) not in keep:
+                shutil.rmtree(os.path.join(versions, entry), ignore_errors=True)
+    if None not in keep:
+        for filename in (INDEX_FILE, DOCSTORE_FILE, SPARSE_FILE):
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _signing_key() -> bytes:
+    """This installation's signing key, created on first use."""
+    try:
+        with open(KNOWLEDGE_BASE_KEY_FILE, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(KNOWLEDGE_BASE_KEY_FILE) or ".", exist_ok=True)
+    try:
+        fd = os.open(KNOWLEDGE_BASE_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process created it first
+        with open(KNOWLEDGE_BASE_KEY_FILE, "rb") as f:
+            return f.read()
+    key = secrets.token_bytes(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _signature(path: str) -> str:
+    signature = hmac.new(_signing_key(), digestmod=hashlib.sha256)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            signature.update(block)
+    return signature.hexdigest()
+
+
+def _load_pickle(path: str, manifest: dict, allow_unsigned: bool):
+    """
+    Unpickle a knowledge base file, refusing it unless the manifest carries
+    this installation's signature for it (or allow_unsigned is set).
+    """
+    expected = manifest.get("signatures", {}).get(os.path.basename(path))
+    if not allow_unsigned and (expected is None or not hmac.compare_digest(expected, _signature(path))):
+        raise ValueError(
+            f"Knowledge base '{manifest.get('name')}' was not saved by this installation "
+            f"({os.path.basename(path)} is unsigned or modified), and loading it would unpickle "
+            "untrusted data. If you trust its directory, set KNOWLEDGE_BASE_ALLOW_UNSIGNED=1; "
+            "it is signed on its next save."
+        )
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _cosine_relevance(score: float) -> float:
+    """Inner product of normalized vectors is already the cosine similarity."""
+    return score
+
+
+def _read_index(path: str, mmap: bool):
+    """Read a FAISS index, memory-mapping its vectors when supported."""
+    faiss = dependable_faiss_import()
+    if mmap:
+        # IO_FLAG_MMAP_IFC maps flat code arrays (newer FAISS); IO_FLAG_MMAP covers IVF lists
+        for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+            flag = getattr(faiss, flag_name, None)
+            if flag is None:
+                continue
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError:
+                continue
+    return faiss.read_index(path), False
+
+
+class KnowledgeBase:
+    """
+    A FAISS index over a set of named files that is updated per file.
+
+    Each file's chunks are added with their own doc ids, so adding a file only
+    embeds that file and removing one deletes only its vectors. Retrievers
+    created from the knowledge base keep working across updates because the
+    underlying vector store is modified in place.
+    """
+
+    def __init__(self, embeddings, model_id: str, name: str = None,
+                 chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, normalized=False,
+                 index_type=vector_index.INDEX_TYPE, precision="fp32"):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        # Numeric format of the embedding model (fp32 | fp16 | bf16 | int8); its vectors differ slightly
+        self.precision = precision
+        self.name = name
+        # Requested index type; 'auto' re-picks it as the corpus grows
+        self.index_type = index_type
+        # Normalized embeddings go in an inner-product index, so scores are cosine similarities
+        self.normalized = normalized
+        self.distance_strategy = (
+            DistanceStrategy.MAX_INNER_PRODUCT if normalized else DistanceStrategy.EUCLIDEAN_DISTANCE
+        )
+        # LangChain's default for inner product maps similarity s to 1 - s, which would invert the threshold
+        self.relevance_score_fn = _cosine_relevance if normalized else None
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.vectorstore = None
+        # BM25 index over the same chunks, keyed by the same doc ids
+        self.sparse_index = BM25Index()
+        # filename -> {"hash": content hash, "ids": doc ids in the vector store}
+        self.files = {}
+        # True while the index is memory-mapped read-only from disk
+        self._mmapped = False
+        # Manifest version this copy was loaded from or last saved as (None if never saved)
+        self._saved_version = None
+        self.dirty = False
+
+    @property
+    def chunk_count(self) -> int:
+        return sum(len(entry["ids"]) for entry in self.files.values())
+
+    @property
+    def version(self) -> str:
+        """Content hash of what is indexed; changes whenever files, chunking or model change."""
+        state = json.dumps(
+            {
+                "embedding_model_id": self.model_id,
+                "embedding_precision": self.precision,
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "normalized": self.normalized,
+                "files": {name: entry["hash"] for name, entry in self.files.items()},
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(state.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def current_index_type(self) -> str:
+        """Type of the FAISS index currently in use."""
+        if self.vectorstore is None:
+            return "flat"
+        return vector_index.index_type_of(self.vectorstore.index)
+
+    def has_file(self, name: str, content_hash: str) -> bool:
+        """True if this exact file content is already indexed under name."""
+        entry = self.files.get(name)
+        return entry is not None and entry["hash"] == content_hash
+
+    def set_embeddings(self, embeddings):
+        """Switch to another instance of the same embedding model, e.g. after it was reloaded."""
+        self.embeddings = embeddings
+        if self.vectorstore is not None:
+            self.vectorstore.embedding_function = embeddings
+
+    def embed_chunks(self, chunks) -> list:
+        """
+        Embed chunks for a later add_file(). Doesn't touch the index, so it
+        can run while other threads search it.
+        """
+        return self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+    def add_file(self, name: str, content_hash: str, chunks, vectors=None) -> int:
+        """
+        Embed and index one file's chunks (split with this knowledge base's
+        chunk_size/chunk_overlap); returns the number of chunks added.
+        vectors, from embed_chunks(), skips the embedding step.
+        """
+        if self.has_file(name, content_hash):
+            return 0
+        if name in self.files:
+            # Same name, new content: replace the old vectors
+            self.remove_file(name)
+
+        for chunk in chunks:
+            chunk.metadata["source"] = name
+        ids = [str(uuid.uuid4()) for _ in chunks]
+
+        if chunks:
+            if vectors is None:
+                vectors = self.embed_chunks(chunks)
+            text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)]
+            metadatas = [chunk.metadata for chunk in chunks]
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(
+                    text_embeddings, self.embeddings, metadatas=metadatas, ids=ids,
+                    distance_strategy=self.distance_strategy,
+                    relevance_score_fn=self.relevance_score_fn,
+                )
+            else:
+                self._ensure_writable()
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            self.sparse_index.add(ids, [chunk.page_content for chunk in chunks])
+
+        self.files[name] = {"hash": content_hash, "ids": ids}
+        self.dirty = True
+        if chunks:
+            self._fit_index_type()
+        return len(chunks)
+
+    def remove_file(self, name: str) -> int:
+        """Delete one file's vectors; returns the number of chunks removed."""
+        entry = self.files.pop(name, None)
+        if entry is None:
+            return 0
+        self.dirty = True
+        if not entry["ids"]:
+            return 0
+        self.sparse_index.remove(entry["ids"])
+        self._ensure_writable()
+        if self.current_index_type in ("flat", "sq8"):
+            self.vectorstore.delete(entry["ids"])
+        else:
+            # HNSW graphs don't support deletion, and IVF lists keep their ids after
+            # remove_ids while LangChain renumbers its mapping; refill from the remaining vectors
+            remaining = self.vectorstore.index.ntotal - len(entry["ids"])
+            self._rebuild_index(
+                vector_index.resolve_index_type(self.index_type, remaining), drop_ids=entry["ids"]
+            )
+        return len(entry["ids"])
+
+    def _fit_index_type(self):
+        """Rebuild the index if the requested/auto-selected type changed with corpus size."""
+        target = vector_index.resolve_index_type(self.index_type, self.vectorstore.index.ntotal)
+        if target != self.current_index_type:
+            self._rebuild_index(target)
+
+    def _rebuild_index(self, index_type: str, drop_ids=()):
+        """
+        Rebuild the FAISS index as index_type from its own vectors, minus
+        drop_ids. An IVF index staying the same type keeps its trained
+        centroids (and PQ codebooks) and is only refilled; retraining on
+        vectors decoded from PQ codes would lose accuracy on every removal.
+        """
+        vectorstore = self.vectorstore
+        drop = set(drop_ids)
+        positions = [
+            position for position, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+            if doc_id not in drop
+        ]
+        vectors = vector_index.reconstruct_vectors(vectorstore.index, positions)
+        if index_type == self.current_index_type and index_type in ("ivf", "ivfpq"):
+            vectorstore.index = vector_index.refill_index(vectorstore.index, vectors)
+        else:
+            vectorstore.index = vector_index.build_index(index_type, vectors, self.normalized)
+        if drop:
+            vectorstore.docstore.delete(list(drop))
+        vectorstore.index_to_docstore_id = {
+            new_position: vectorstore.index_to_docstore_id[old_position]
+            for new_position, old_position in enumerate(positions)
+        }
+
+    def as_retriever(self, **kwargs):
+        """
+        Retriever over the index. With normalized embeddings and
+        RETRIEVAL_SCORE_THRESHOLD set, chunks below that cosine similarity
+        are dropped. With HYBRID_SEARCH on, dense results are fused with
+        BM25 keyword results (unless a search_type is given); the threshold
+        applies to keyword hits as well.
+        """
+        if self.vectorstore is None:
+            raise ValueError("Knowledge base is empty. Add at least one file first.")
+        hybrid = HYBRID_SEARCH and len(self.sparse_index) and "search_type" not in kwargs
+        search_kwargs = dict(kwargs.pop("search_kwargs", {}))
+        k = search_kwargs.get("k", 4)
+        if hybrid:
+            # The dense side contributes a wider candidate list to the fusion
+            search_kwargs["k"] = max(k, HYBRID_FETCH_K)
+        threshold = 0.0
+        if self.normalized and RETRIEVAL_SCORE_THRESHOLD > 0 and "search_type" not in kwargs:
+            threshold = RETRIEVAL_SCORE_THRESHOLD
+            kwargs["search_type"] = "similarity_score_threshold"
+            search_kwargs["score_threshold"] = threshold
+        dense = self.vectorstore.as_retriever(search_kwargs=search_kwargs, **kwargs)
+        if not hybrid:
+            return dense
+        return HybridRetriever(
+            dense_retriever=dense,
+            sparse_index=self.sparse_index,
+            docstore=self.vectorstore.docstore,
+            k=k,
+            fetch_k=max(k, HYBRID_FETCH_K),
+            embeddings=self.embeddings,
+            score_threshold=threshold,
+        )
+
+    # --- Persistence ---
+
+    def manifest(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "embedding_model_id": self.model_id,
+            "embedding_precision": self.precision,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "normalized": self.normalized,
+            "index_type": self.current_index_type,
+            "files": self.files,
+            "updated_at": time.time(),
+        }
+
+    def save(self):
+        """
+        Write index, docstore and sparse index to a new version directory,
+        then point the manifest at it with a single atomic rename, so readers
+        see either the previous or the new knowledge base, never a mix.
+
+        Raises StaleKnowledgeBaseError if the knowledge base on disk is no
+        longer the version this copy was loaded from; reopen it and retry.
+        """
+        if not self.name:
+            raise ValueError("Cannot save an unnamed knowledge base.")
+        directory = knowledge_base_path(self.name)
+        os.makedirs(directory, exist_ok=True)
+        faiss = dependable_faiss_import()
+
+        with _SAVE_LOCK:
+            current = read_manifest(directory)
+            current_version = current["version"] if current else None
+            if current_version != self._saved_version:
+                raise StaleKnowledgeBaseError(
+                    f"Knowledge base '{self.name}' was changed by another writer since it was "
+                    f"loaded (on disk: {current_version}, loaded: {self._saved_version}). "
+                    "Reopen it and retry."
+                )
+
+            manifest = self.manifest()
+            if self.vectorstore is not None:
+                data_dir = os.path.join(VERSIONS_DIR, f"{manifest['version']}-{uuid.uuid4().hex[:8]}")
+                target = os.path.join(directory, data_dir)
+                os.makedirs(target)
+                faiss.write_index(self.vectorstore.index, os.path.join(target, INDEX_FILE))
+                with open(os.path.join(target, DOCSTORE_FILE), "wb") as f:
+                    pickle.dump((self.vectorstore.docstore, self.vectorstore.index_to_docstore_id), f)
+                with open(os.path.join(target, SPARSE_FILE), "wb") as f:
+                    pickle.dump(self.sparse_index, f)
+                manifest["data_dir"] = data_dir
+                manifest["signatures"] = {
+                    filename: _signature(os.path.join(target, filename))
+                    for filename in (DOCSTORE_FILE, SPARSE_FILE)
+                }
+            write_manifest(directory, manifest)
+            self._saved_version = manifest["version"]
+            # Keep the replaced version too, for readers in other processes still loading it
+            _prune_versions(directory, {manifest.get("data_dir"), current.get("data_dir") if current else None})
+        self.dirty = False
+
+    @classmethod
+    def exists(cls, name: str) -> bool:
+        return os.path.exists(os.path.join(knowledge_base_path(name), MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, name: str, embeddings, model_id: str, normalized=False, mmap: bool = True,
+             index_type=vector_index.INDEX_TYPE, precision="fp32", allow_unsigned: bool = False):
+        """
+        Reopen a saved knowledge base.
+
+        With mmap=True the vectors are memory-mapped read-only, so every
+        session opening the same knowledge base shares one copy in the page
+        cache. The index is copied into memory on the first modification.
+
+        The docstore and sparse index are pickles, so they are only loaded
+        if this installation signed them on save; allow_unsigned skips the
+        check for directories you trust.
+        """
+        directory = knowledge_base_path(name)
+        manifest = read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"Knowledge base '{name}' not found in {KNOWLEDGE_BASE_DIR}.")
+        if manifest["embedding_model_id"] != model_id:
+            raise ValueError(
+                f"Knowledge base '{name}' was built with '{manifest['embedding_model_id']}', "
+                f"not '{model_id}'."
+            )
+        if manifest.get("normalized", False) != normalized:
+            raise ValueError(
+                f"Knowledge base '{name}' was built with normalize_embeddings="
+                f"{manifest.get('normalized', False)}; set EMBEDDING_NORMALIZE to match or use another name."
+            )
+        if manifest.get("embedding_precision", "fp32") != precision:
+            raise ValueError(
+                f"Knowledge base '{name}' was built with {manifest.get('embedding_precision', 'fp32')} "
+                f"embeddings, not {precision}; set EMBEDDING_PRECISION/EMBEDDING_QUANTIZE to match "
+                "or use another name."
+            )
+
+        kb = cls(
+            embeddings,
+            model_id=model_id,
+            name=name,
+            chunk_size=manifest["chunk_size"],
+            chunk_overlap=manifest["chunk_overlap"],
+            normalized=normalized,
+            index_type=index_type,
+            precision=precision,
+        )
+        kb.files = manifest["files"]
+        kb._saved_version = manifest.get("version")
+
+        data = data_directory(directory, manifest)
+        index_path = os.path.join(data, INDEX_FILE)
+        if os.path.exists(index_path):
+            index, kb._mmapped = _read_index(index_path, mmap)
+            vector_index.set_search_params(index)
+            docstore, index_to_docstore_id = _load_pickle(
+                os.path.join(data, DOCSTORE_FILE), manifest, allow_unsigned,
+            )
+            kb.vectorstore = FAISS(
+                embeddings, index, docstore, index_to_docstore_id,
+                distance_strategy=kb.distance_strategy,
+                relevance_score_fn=kb.relevance_score_fn,
+            )
+
+            sparse_path = os.path.join(data, SPARSE_FILE)
+            if os.path.exists(sparse_path):
+                kb.sparse_index = _load_pickle(sparse_path, manifest, allow_unsigned)
+            else:
+                # Saved before the sparse index existed: build it from the stored chunks
+                doc_ids = list(index_to_docstore_id.values())
+                kb.sparse_index.add(doc_ids, [docstore.search(doc_id).page_content for doc_id in doc_ids])
+        return kb
+
+    @classmethod
+    def delete(cls, name: str):
+        """Remove a saved knowledge base from disk."""
+        close_knowledge_base(name)
+        shutil.rmtree(knowledge_base_path(name), ignore_errors=True)
+
+    def _ensure_writable(self):
+        """Swap a memory-mapped read-only index for an in-memory copy."""
+        if not self._mmapped:
+            return
+        faiss = dependable_faiss_import()
+        self.vectorstore.index = faiss.deserialize_index(faiss.serialize_index(self.vectorstore.index))
+        vector_index.set_search_params(self.vectorstore.index)
+        self._mmapped = False
+
+
+class ReadWriteLock:
+    """
+    Many concurrent readers or one writer. Queries search the index
+    concurrently; ingestion and removal wait for them and run alone, since
+    FAISS doesn't allow adding to an index while it is being searched.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+def open_knowledge_base(name: str, embeddings, model_id: str, normalized=False, precision="fp32"):
+    """
+    The process-wide KnowledgeBase for name and its ReadWriteLock, loaded
+    from disk or created on first use. Every session and request on the same
+    name shares this one instance, so none of them saves a stale copy over
+    another's changes.
+    """
+    opened = _OPEN_KNOWLEDGE_BASES.get(name)
+    if opened is not None:
+        return opened
+    with _OPEN_KNOWLEDGE_BASES_LOCK:
+        load_lock = _LOAD_LOCKS.setdefault(name, threading.Lock())
+    with load_lock:
+        # Another thread may have finished loading it while we waited
+        opened = _OPEN_KNOWLEDGE_BASES.get(name)
+        if opened is None:
+            if KnowledgeBase.exists(name):
+                knowledge_base = KnowledgeBase.load(
+                    name, embeddings, model_id, normalized=normalized, precision=precision,
+                    allow_unsigned=KNOWLEDGE_BASE_ALLOW_UNSIGNED,
+                )
+            else:
+                knowledge_base = KnowledgeBase(
+                    embeddings, model_id, name=name, normalized=normalized, precision=precision,
+                )
+            opened = (knowledge_base, ReadWriteLock())
+            with _OPEN_KNOWLEDGE_BASES_LOCK:
+                _OPEN_KNOWLEDGE_BASES[name] = opened
+        return opened
+
+
+def close_knowledge_base(name: str):
+    """Drop the shared instance for name, so the next open_knowledge_base reloads it from disk."""
+    with _OPEN_KNOWLEDGE_BASES_LOCK:
+        _OPEN_KNOWLEDGE_BASES.pop(name, None)
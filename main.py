@@ -1,16 +1,64 @@
 import streamlit as st
-from models import get_embedding_model, get_llm, verify_llm_model_availability, DEFAULT_API_BASE, DEFAULT_API_KEY, DEFAULT_MODEL_NAME
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_classic.chains.retrieval_qa.base import RetrievalQA
-from langchain_core.prompts import PromptTemplate
-import tempfile
+from models import get_embedding_model, get_embedding_precision, get_llm, verify_llm_model_availability, is_embedding_model_loaded, is_model_cached, unload_embedding_model, warm_up_embedding_model, HF_CACHE, DEFAULT_API_BASE, DEFAULT_API_KEY, DEFAULT_MODEL_NAME, EMBEDDING_MODEL_ID, EMBEDDING_NORMALIZE, EMBEDDING_WARMUP_ENABLED
+from knowledge_base import RETRIEVAL_K, KnowledgeBase, StaleKnowledgeBaseError, close_knowledge_base, file_hash, list_knowledge_bases, open_knowledge_base
+from ingest import ingest_files
+from rag import stream_answer
+from answer_cache import get_answer_cache
+from reranker import RERANK_ENABLED, reranking_retriever
+from context_packer import CONTEXT_FETCH_K, CONTEXT_PACKING, ContextPackingRetriever
+import time
 import os
 
 # Page config
 st.set_page_config(page_title="ChatRAG", page_icon="💬", layout="wide")
 
+# Warm up the shared embedding model once per server process, not per session
+@st.cache_resource
+def start_embedding_warm_up():
+    return warm_up_embedding_model()
+
+if EMBEDDING_WARMUP_ENABLED:
+    start_embedding_warm_up()
+
+# Past messages rendered on each rerun; older ones appear on request
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+
+# Cheap-to-read, slow-to-compute sidebar data, shared by all sessions for a few seconds
+@st.cache_data(ttl=30, show_spinner=False)
+def embedding_model_in_cache(model_id):
+    return is_model_cached(model_id)
+
+@st.cache_data(ttl=5, show_spinner=False)
+def embedding_cache_stats(_embeddings):
+    # Counting the on-disk cache scans the whole table. Takes the session's model rather than
+    # calling get_embedding_model(), which would load it again right after a reload unloaded it
+    return _embeddings.stats()
+
+def sources_markdown(sources, preview_chars):
+    """Sources expander body, built once when the message is created, not on every rerun."""
+    return "\n\n".join(
+        f"**Source {i+1}:** {doc.page_content[:preview_chars]}..." for i, doc in enumerate(sources)
+    )
+
+@st.fragment
+def render_history(messages):
+    """
+    Renders the last HISTORY_WINDOW messages. Showing earlier ones reruns
+    only this fragment, not the whole script.
+    """
+    hidden = len(messages) - HISTORY_WINDOW
+    if hidden > 0 and not st.session_state.get("show_full_history"):
+        if st.button(f"⬆️ Show {hidden} earlier message(s)"):
+            st.session_state.show_full_history = True
+            st.rerun(scope="fragment")
+        messages = messages[hidden:]
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if message.get("sources_md"):
+                with st.expander("📚 Sources"):
+                    st.markdown(message["sources_md"])
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -82,25 +130,42 @@ with st.sidebar:
     # Embedding Model - Load from Local Cache Only
     st.subheader("📦 Embedding Model")
     
-    EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_MODEL_NAME = EMBEDDING_MODEL_ID
     
     # Show cache status
-    import os
-    hf_cache = os.getenv("HF_HOME", os.path.expanduser("~/.cache/huggingface"))
-    from pathlib import Path
-    cache_dir = Path(hf_cache) / "hub"
-    model_dirs = list(cache_dir.glob(f"models--{EMBEDDING_MODEL_NAME.replace('/', '--')}--*")) if cache_dir.exists() else []
-    if model_dirs:
-        st.caption(f"📁 Found in cache: `{hf_cache}`")
+    if embedding_model_in_cache(EMBEDDING_MODEL_NAME):
+        st.caption(f"📁 Found in cache: `{HF_CACHE}`")
     else:
-        st.caption(f"📁 Cache: `{hf_cache}` (not found)")
+        st.caption(f"📁 Cache: `{HF_CACHE}` (not found)")
+    
+    # Attach the process-wide model if another session or the warm-up already loaded (or reloaded) it
+    if is_embedding_model_loaded() and st.session_state.get("embedding_model") is not get_embedding_model():
+        st.session_state.embedding_model = get_embedding_model()
+        st.session_state.pop("retriever", None)
     
     # Check if model is loaded
     if "embedding_model" in st.session_state and st.session_state.embedding_model is not None:
         st.success("✅ Embedding model loaded")
         if st.button("🔄 Reload Model", use_container_width=True):
-            st.session_state.embedding_model = None
-            st.rerun()
+            # Drop the shared instance, otherwise loading would hand the same one back
+            unload_embedding_model()
+            st.session_state.pop("embedding_model", None)
+            st.session_state.pop("retriever", None)
+            with st.spinner(f"Reloading {EMBEDDING_MODEL_NAME} from local cache..."):
+                try:
+                    st.session_state.embedding_model = get_embedding_model()
+                except Exception as e:
+                    st.error(f"❌ Failed to reload model: {type(e).__name__}: {e}")
+            knowledge_base = st.session_state.get("knowledge_base")
+            if knowledge_base is not None and st.session_state.get("embedding_model") is not None:
+                # Other sessions share this knowledge base: switch it over in place, not reopen a second copy
+                st.session_state.kb_lock.acquire_write()
+                try:
+                    knowledge_base.set_embeddings(st.session_state.embedding_model)
+                finally:
+                    st.session_state.kb_lock.release_write()
+            if st.session_state.get("embedding_model") is not None:
+                st.rerun()
     else:
         st.warning("⚠️ Embedding model not loaded")
         if st.button("📂 Load from Cache", type="primary", use_container_width=True):
@@ -131,13 +196,66 @@ with st.sidebar:
     
     st.caption(f"Model: `{EMBEDDING_MODEL_NAME}` (auto GPU/CPU)")
     
+    # Embedding cache counters
+    if hasattr(st.session_state.get("embedding_model"), "stats"):
+        cache_stats = embedding_cache_stats(st.session_state.embedding_model)
+        st.caption(
+            f"🗄️ Embedding cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['entries']} vectors, {cache_stats['size_mb']:.1f} MB)"
+        )
+        if cache_stats["encoded"]:
+            st.caption(f"⚡ Encoder throughput: {cache_stats['chunks_per_sec']:.1f} chunks/sec")
+    
+    st.divider()
+    
+    # Knowledge Base - saved on disk and reopened across refreshes/restarts
+    st.subheader("📚 Knowledge Base")
+    
+    kb_name = st.text_input(
+        "Knowledge Base Name",
+        value=st.session_state.get("kb_name", "default"),
+        help="Indexed documents are saved under this name and reopened on refresh or restart"
+    )
+    if kb_name != st.session_state.get("kb_name"):
+        st.session_state.kb_name = kb_name
+        st.session_state.pop("knowledge_base", None)
+        st.session_state.pop("kb_lock", None)
+        st.session_state.pop("retriever", None)
+        st.session_state.pop("last_files", None)
+    
+    saved_kbs = list_knowledge_bases()
+    st.caption(f"💾 Saved: {', '.join(f'`{name}`' for name in saved_kbs) if saved_kbs else 'none'}")
+    if st.session_state.get("knowledge_base") is not None:
+        # Other sessions may be adding or removing files meanwhile
+        st.session_state.kb_lock.acquire_read()
+        try:
+            index_type = st.session_state.knowledge_base.current_index_type
+            chunk_count = st.session_state.knowledge_base.chunk_count
+        finally:
+            st.session_state.kb_lock.release_read()
+        st.caption(f"🧭 Index: `{index_type}` ({chunk_count} chunks)")
+    
+    if kb_name in saved_kbs and st.button("🗑️ Delete Knowledge Base", use_container_width=True):
+        KnowledgeBase.delete(kb_name)
+        st.session_state.pop("knowledge_base", None)
+        st.session_state.pop("kb_lock", None)
+        st.session_state.pop("retriever", None)
+        st.session_state.pop("last_files", None)
+        st.rerun()
+    
+    # Answer cache hit rate (shared by all sessions)
+    answer_cache_stats = get_answer_cache().stats()
+    st.caption(
+        f"💬 Answer cache: {answer_cache_stats['hits']}/{answer_cache_stats['lookups']} hits "
+        f"({answer_cache_stats['hit_rate']:.0%}), {answer_cache_stats['entries']} entries"
+    )
+    
     st.divider()
     
     # Clear chat
     if st.button("🗑️ Clear Chat", use_container_width=True):
         st.session_state.messages = []
-        if "qa_chain" in st.session_state:
-            del st.session_state.qa_chain
+        st.session_state.pop("show_full_history", None)
         st.rerun()
 
 # Main area
@@ -156,65 +274,117 @@ uploaded_files = st.file_uploader(
     help="Upload one or more documents to chat with"
 )
 
-# Process uploaded files - only if embedding model is loaded
-if uploaded_files and st.session_state.get("llm_connected"):
+# Open the knowledge base - one instance per name shared by all sessions, reopened from disk if it was saved before
+if st.session_state.get("embedding_model") is not None and "knowledge_base" not in st.session_state:
+    try:
+        st.session_state.knowledge_base, st.session_state.kb_lock = open_knowledge_base(
+            st.session_state.kb_name, st.session_state.embedding_model, EMBEDDING_MODEL_ID,
+            normalized=EMBEDDING_NORMALIZE, precision=get_embedding_precision(),
+        )
+    except (ValueError, OSError) as e:
+        st.error(f"❌ Failed to open knowledge base: {e}")
+
+# Sync the knowledge base with the uploader - only if embedding model is loaded.
+# This also runs when every file was cleared from the uploader, so their vectors are removed
+current_files = [f.name for f in uploaded_files or []]
+if st.session_state.get("llm_connected"):
     if "embedding_model" not in st.session_state or st.session_state.embedding_model is None:
-        st.warning("⚠️ Please download the embedding model first (sidebar)")
-    elif "qa_chain" not in st.session_state or st.session_state.get("last_files") != [f.name for f in uploaded_files]:
+        if uploaded_files:
+            st.warning("⚠️ Please download the embedding model first (sidebar)")
+    elif "knowledge_base" in st.session_state and st.session_state.get("last_files", []) != current_files:
+        knowledge_base = st.session_state.knowledge_base
+        
         with st.spinner("Processing documents..."):
-            # Load documents
-            documents = []
-            for uploaded_file in uploaded_files:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    tmp_path = tmp_file.name
-                
-                try:
-                    if uploaded_file.name.endswith(".pdf"):
-                        loader = PyPDFLoader(tmp_path)
-                    elif uploaded_file.name.endswith(".docx"):
-                        loader = Docx2txtLoader(tmp_path)
-                    else:
-                        loader = TextLoader(tmp_path)
-                    documents.extend(loader.load())
-                finally:
-                    os.unlink(tmp_path)
-            
-            # Split documents
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            texts = text_splitter.split_documents(documents)
+            # Collect new or changed files; they are parsed straight from memory
+            pending = {}
+            for uploaded_file in uploaded_files or []:
+                data = uploaded_file.getvalue()
+                content_hash = file_hash(data)
+                if knowledge_base.has_file(uploaded_file.name, content_hash):
+                    continue
+                pending[uploaded_file.name] = (data, content_hash)
             
-            # Create vector store
-            vectorstore = FAISS.from_documents(texts, st.session_state.embedding_model)
+            # Parse/chunk in parallel; embed each file's chunks as soon as it is ready.
+            # Other sessions share this knowledge base and keep searching it meanwhile
+            embedded = []
+            timings = []
+            for result in ingest_files(
+                [data for data, _ in pending.values()],
+                sources=list(pending),
+                chunk_size=knowledge_base.chunk_size,
+                chunk_overlap=knowledge_base.chunk_overlap,
+            ):
+                if result.error:
+                    st.error(f"❌ Failed to load {result.source}: {result.error}")
+                    continue
+                embed_start = time.perf_counter()
+                embedded.append((result, knowledge_base.embed_chunks(result.chunks)))
+                embed_seconds = time.perf_counter() - embed_start
+                timings.append({
+                    "File": result.source,
+                    "Chunks": len(result.chunks),
+                    "Parse (s)": round(result.parse_seconds, 2),
+                    "Split (s)": round(result.split_seconds, 2),
+                    "Embed (s)": round(embed_seconds, 2),
+                    "Chunks/s": round(len(result.chunks) / embed_seconds, 1) if embed_seconds else None,
+                })
             
-            # Create QA chain
-            prompt_template = """Use the following pieces of context to answer the question at the end. 
-If you don't know the answer, just say that you don't know, don't try to make up an answer.
-
-{context}
+            # Changing the index waits for other sessions' searches, and makes theirs wait
+            kb_lock = st.session_state.kb_lock
+            kb_lock.acquire_write()
+            try:
+                # Drop vectors of files removed from the uploader since the last run
+                removed_files = [name for name in st.session_state.get("last_files", []) if name not in current_files]
+                for name in removed_files:
+                    knowledge_base.remove_file(name)
+                
+                added_chunks = 0
+                for result, vectors in embedded:
+                    added_chunks += knowledge_base.add_file(result.source, pending[result.source][1], result.chunks, vectors)
+                
+                if knowledge_base.dirty:
+                    knowledge_base.save()
+                st.session_state.last_files = current_files
+                st.success(
+                    f"✅ Added {len(embedded)} document(s) ({added_chunks} chunks), removed {len(removed_files)}; "
+                    f"knowledge base holds {knowledge_base.chunk_count} chunks"
+                )
+            except StaleKnowledgeBaseError as e:
+                # Saved by another process meanwhile: reopen from disk on the next run
+                st.error(f"❌ {e}")
+                close_knowledge_base(st.session_state.kb_name)
+                for key in ("knowledge_base", "kb_lock", "retriever", "last_files"):
+                    st.session_state.pop(key, None)
+            finally:
+                kb_lock.release_write()
+            if timings:
+                with st.expander("⏱️ Ingestion timing"):
+                    st.dataframe(timings, use_container_width=True, hide_index=True)
 
-Question: {question}
-Answer:"""
-            PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-            
-            st.session_state.qa_chain = RetrievalQA.from_chain_type(
-                llm=st.session_state.llm,
-                chain_type="stuff",
-                retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-                chain_type_kwargs={"prompt": PROMPT},
-                return_source_documents=True
-            )
-            st.session_state.last_files = [f.name for f in uploaded_files]
-            st.success(f"✅ Processed {len(uploaded_files)} document(s) into {len(texts)} chunks")
+# Create the retriever once; it follows in-place index updates
+knowledge_base = st.session_state.get("knowledge_base")
+if (
+    "retriever" not in st.session_state
+    and knowledge_base is not None
+    and knowledge_base.vectorstore is not None
+):
+    # With context packing, fetch more candidates and keep what fits the token budget
+    retrieval_k = CONTEXT_FETCH_K if CONTEXT_PACKING else RETRIEVAL_K
+    retriever = knowledge_base.as_retriever(search_kwargs={"k": retrieval_k})
+    if RERANK_ENABLED:
+        try:
+            retriever = reranking_retriever(knowledge_base, retrieval_k)
+        except RuntimeError as e:
+            st.warning(f"⚠️ Reranking disabled: {e}")
+    if CONTEXT_PACKING:
+        retriever = ContextPackingRetriever(
+            base_retriever=retriever,
+            model_name=st.session_state.get("model_name", DEFAULT_MODEL_NAME),
+        )
+    st.session_state.retriever = retriever
 
 # Display chat messages
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-        if message["role"] == "assistant" and "sources" in message:
-            with st.expander("📚 Sources"):
-                for i, doc in enumerate(message["sources"]):
-                    st.markdown(f"**Source {i+1}:** {doc.page_content[:200]}...")
+render_history(st.session_state.messages)
 
 # Chat input
 if prompt := st.chat_input("Ask a question about your documents..."):
@@ -222,7 +392,7 @@ if prompt := st.chat_input("Ask a question about your documents..."):
         st.error("⚠️ Please configure and connect to an LLM first (sidebar)")
     elif "embedding_model" not in st.session_state or st.session_state.embedding_model is None:
         st.error("⚠️ Please download the embedding model first (sidebar)")
-    elif "qa_chain" not in st.session_state:
+    elif "retriever" not in st.session_state:
         st.error("⚠️ Please upload at least one document first")
     else:
         # Add user message
@@ -230,33 +400,60 @@ if prompt := st.chat_input("Ask a question about your documents..."):
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Generate response
+        # Generate response - tokens are rendered as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
+            try:
+                # Same question (or a near-duplicate) on the same documents and model: skip the LLM
+                answer_cache = get_answer_cache()
+                st.session_state.kb_lock.acquire_read()
                 try:
-                    result = st.session_state.qa_chain({"query": prompt})
-                    answer = result["result"]
-                    sources = result.get("source_documents", [])
-                    
+                    kb_version = st.session_state.knowledge_base.version
+                finally:
+                    st.session_state.kb_lock.release_read()
+                cache_version = f"{kb_version}:{st.session_state.llm.model_name}"
+                query_vector = st.session_state.embedding_model.embed_query(prompt)
+                cached = answer_cache.lookup(cache_version, query_vector)
+                
+                if cached is not None:
+                    answer = cached.answer
+                    sources = cached.sources
                     st.markdown(answer)
-                    
-                    if sources:
-                        with st.expander("📚 Sources"):
-                            for i, doc in enumerate(sources):
-                                st.markdown(f"**Source {i+1}:** {doc.page_content[:300]}...")
-                    
-                    # Add to history
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": answer,
-                        "sources": sources
-                    })
-                except Exception as e:
-                    st.error(f"Error: {e}")
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": f"Error: {e}"
-                    })
+                    st.caption(f"⚡ Answered from cache (similarity {cached.similarity:.2f})")
+                else:
+                    with st.spinner("Searching documents..."):
+                        # Retrieval runs under the shared read lock; generation doesn't need it
+                        st.session_state.kb_lock.acquire_read()
+                        try:
+                            sources, tokens = stream_answer(st.session_state.llm, st.session_state.retriever, prompt)
+                        finally:
+                            st.session_state.kb_lock.release_read()
+                    answer = st.write_stream(tokens)
+                    answer_cache.store(cache_version, prompt, query_vector, answer, sources)
+                    # The reranker may be wrapped by the context packer
+                    retriever = getattr(st.session_state.retriever, "base_retriever", st.session_state.retriever)
+                    if hasattr(retriever, "last_latency_ms"):
+                        st.caption(
+                            f"🎯 Reranked {retriever.last_candidates} candidates in {retriever.last_latency_ms:.0f} ms "
+                            f"(mean {retriever.stats()['mean_ms']:.0f} ms)"
+                        )
+                
+                if sources:
+                    with st.expander("📚 Sources"):
+                        st.markdown(sources_markdown(sources, 300))
+                
+                # Add to history
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": answer,
+                    "sources": sources,
+                    "sources_md": sources_markdown(sources, 200),
+                })
+            except Exception as e:
+                st.error(f"Error: {e}")
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"Error: {e}"
+                })
 
 # Footer
 st.divider()
@@ -1,45 +1,147 @@
 # mcp_main.py
-import io
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from transformers import pipeline
 from docx import Document
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
+from summarizers import LocalPipelineSummarizer, OpenAICompatibleSummarizer, SummarizerBackend
 
 # --- Model and App Initialization ---
 
+@asynccontextmanager
+async def lifespan(app):
+    if WARMUP_ON_STARTUP:
+        # Don't await: the server accepts connections while the model loads
+        asyncio.get_running_loop().run_in_executor(summary_executor, backend.load)
+    yield
+
 # Initialize the FastAPI app
 app = FastAPI(
     title="Document Summarization MCP",
     description="A microservice to summarize texts and generate a document.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
-# Load the text generation model from Hugging Face.
-# This happens only once when the server starts.
-try:
-    # Using GPT-2 for text generation, which is available in older transformers versions
-    generator = pipeline("text-generation", model="gpt2")
-    print("Text generation model loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    generator = None
+# Summarization backend: local (in-process pipeline) | openai (OpenAI-compatible server)
+SUMMARY_BACKEND = os.getenv("MCP_SUMMARY_BACKEND", "local")
+
+# Generation runs in this bounded pool so the event loop keeps serving /health and other requests.
+# The local pipeline generates one batch at a time, so extra workers would only queue behind it
+SUMMARY_WORKERS = int(os.getenv("MCP_SUMMARY_WORKERS", "1" if SUMMARY_BACKEND == "local" else "2"))
+# Documents summarized together in one forward pass
+SUMMARY_BATCH_SIZE = int(os.getenv("MCP_SUMMARY_BATCH_SIZE", "8"))
+
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summarizer")
+
+# Map-reduce mode: token budget per chunk (GPT-2's context is 1024 tokens, incl. prompt and 150 new)
+MAP_CHUNK_TOKENS = int(os.getenv("MCP_MAP_CHUNK_TOKENS", "600"))
+# Summaries of individual chunks, keyed by chunk text hash, so edited documents only redo changed chunks
+SUMMARY_CACHE_SIZE = int(os.getenv("MCP_SUMMARY_CACHE_SIZE", "4096"))
+
+summary_cache = OrderedDict()
+summary_cache_lock = threading.Lock()
+
+# Local backend: loaded on first use (or via POST /warmup), not at import, so the server starts in milliseconds
+MODEL_NAME = os.getenv("MCP_MODEL_NAME", "gpt2")
+# Start loading the model in the background as soon as the server starts
+WARMUP_ON_STARTUP = os.getenv("MCP_WARMUP_ON_STARTUP", "0") != "0"
+# OpenAI-compatible backend: defaults to the same server as chat
+LLM_API_BASE = os.getenv("MCP_LLM_API_BASE", os.getenv("LLM_API_BASE", "http://192.168.96.1:1234/v1"))
+LLM_API_KEY = os.getenv("MCP_LLM_API_KEY", os.getenv("LLM_API_KEY", "not-needed"))
+LLM_MODEL_NAME = os.getenv("MCP_LLM_MODEL_NAME", os.getenv("LLM_MODEL_NAME", "llama-3.2-1b-instruct"))
+LLM_CONCURRENCY = int(os.getenv("MCP_LLM_CONCURRENCY", "8"))  # parallel requests (and pooled connections)
+LLM_CHUNK_WORDS = int(os.getenv("MCP_LLM_CHUNK_WORDS", "1500"))  # map-reduce chunk size for remote models
+
+def create_backend() -> SummarizerBackend:
+    if SUMMARY_BACKEND == "local":
+        return LocalPipelineSummarizer(MODEL_NAME, batch_size=SUMMARY_BATCH_SIZE, chunk_tokens=MAP_CHUNK_TOKENS)
+    if SUMMARY_BACKEND == "openai":
+        return OpenAICompatibleSummarizer(
+            LLM_API_BASE, LLM_API_KEY, LLM_MODEL_NAME,
+            concurrency=LLM_CONCURRENCY, chunk_tokens=LLM_CHUNK_WORDS,
+        )
+    raise ValueError(f"Unknown MCP_SUMMARY_BACKEND '{SUMMARY_BACKEND}'. Use 'local' or 'openai'.")
+
+# Creating a backend is cheap; models load and connections open on first use
+backend = create_backend()
+
+# Rendered document bytes are kept in memory up to this size, then spooled to disk. This only
+# avoids a second in-memory copy of large reports: the PDF/DOCX libraries build the whole
+# document in memory before writing it out
+SPOOL_MAX_BYTES = int(os.getenv("MCP_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Job API: jobs run one batch of documents at a time behind a bounded queue.
+# MAX_CONCURRENT_JOBS also bounds synchronous requests: both share the same slots
+MAX_CONCURRENT_JOBS = int(os.getenv("MCP_MAX_CONCURRENT_JOBS", "1"))
+MAX_QUEUED_JOBS = int(os.getenv("MCP_MAX_QUEUED_JOBS", "100"))
+JOB_TTL_SECONDS = float(os.getenv("MCP_JOB_TTL_SECONDS", "3600"))
+JOB_RESULT_DIR = os.getenv("MCP_JOB_RESULT_DIR", os.path.join(tempfile.gettempdir(), "mcp-jobs"))
+
+jobs = {}
+job_queue = None
+job_workers = []
+job_slots = None
 
 # --- Pydantic Models for Request Body ---
 
 class SummarizationRequest(BaseModel):
     documents: dict[str, str] = Field(..., description="A dictionary where keys are filenames and values are the document's text content.")
     doc_type: str = Field("pdf", description="The desired output document type. Either 'pdf' or 'docx'.")
+    mode: str = Field("map_reduce", description="'map_reduce' summarizes the full text chunk by chunk, then combines; 'truncate' summarizes only the first 500 characters.")
+
+class SummarizationJob:
+    """State of one queued summarization request."""
+    
+    def __init__(self, request: SummarizationRequest):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"  # queued | running | done | failed
+        self.documents = {filename: "pending" for filename in request.documents}
+        self.error = None
+        self.result_path = None
+        self.created = time.time()
+        self.finished = None
+    
+    def to_dict(self) -> dict:
+        completed = sum(1 for state in self.documents.values() if state == "done")
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "documents": self.documents,
+            "completed": completed,
+            "total": len(self.documents),
+            "error": self.error,
+        }
 
 # --- Helper Functions for Document Generation ---
 
-def create_pdf_from_summaries(summaries: dict[str, str]) -> io.BytesIO:
-    """Generates a PDF document from a dictionary of summaries."""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
+def _spooled_file():
+    # Small documents stay in memory; larger ones spill to a temp file
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+
+def create_pdf_from_summaries(summaries: dict[str, str], output=None):
+    """
+    Generates a PDF document from a dictionary of summaries, written to
+    output (a binary file object; default a new spooled temp file).
+    Returns output rewound to the start.
+    """
+    output = output if output is not None else _spooled_file()
+    doc = SimpleDocTemplate(output, pagesize=letter)
     styles = getSampleStyleSheet()
     story = []
 
@@ -50,12 +152,16 @@ def create_pdf_from_summaries(summaries: dict[str, str]) -> io.BytesIO:
         story.append(Spacer(1, 24))
 
     doc.build(story)
-    buffer.seek(0)
-    return buffer
+    output.seek(0)
+    return output
 
-def create_docx_from_summaries(summaries: dict[str, str]) -> io.BytesIO:
-    """Generates a DOCX document from a dictionary of summaries."""
-    buffer = io.BytesIO()
+def create_docx_from_summaries(summaries: dict[str, str], output=None):
+    """
+    Generates a DOCX document from a dictionary of summaries, written to
+    output (a binary file object; default a new spooled temp file).
+    Returns output rewound to the start.
+    """
+    output = output if output is not None else _spooled_file()
     doc = Document()
 
     for filename, summary in summaries.items():
@@ -63,47 +169,267 @@ def create_docx_from_summaries(summaries: dict[str, str]) -> io.BytesIO:
         doc.add_paragraph(summary)
         doc.add_paragraph()  # Add a little space
 
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    doc.save(output)
+    output.seek(0)
+    return output
+
+def _write_document(build_document, summaries: dict[str, str], path: str):
+    """Renders straight into a file at path, via a temp name so readers never see a partial file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        build_document(summaries, f)
+    os.replace(tmp_path, path)
+
+def _iter_file(f):
+    """Yields a file's contents in fixed-size chunks, then closes it."""
+    try:
+        while True:
+            chunk = f.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
 
 # --- Helper Function for Text Generation ---
 
-def generate_summary(text: str) -> str:
-    """Generate a summary of the given text using the language model."""
-    if not generator:
-        return "Summarization model is not available."
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _generate(texts: list[str]) -> list[str]:
+    """
+    Summarize texts that already fit the model's context, batching them
+    through the language model. Results are cached by text hash.
+    """
+    if not backend.load():
+        return ["Summarization model is not available."] * len(texts)
+    
+    # The backend is part of the key so switching models doesn't serve stale summaries
+    keys = [_text_key(f"{backend.name}\0{text}") for text in texts]
+    summaries = {}
+    with summary_cache_lock:
+        for key in keys:
+            if key in summary_cache:
+                summary_cache.move_to_end(key)
+                summaries[key] = summary_cache[key]
     
+    # Duplicate texts in one batch are generated once
+    missing = {key: text for key, text in zip(keys, texts) if key not in summaries}
+    if missing:
+        results = backend.summarize(list(missing.values()))
+        with summary_cache_lock:
+            for key, summary in zip(missing, results):
+                if summary is None:
+                    # Failures aren't cached, so the next request retries them
+                    summaries[key] = "Failed to generate summary."
+                    continue
+                summaries[key] = summary
+                summary_cache[key] = summary
+            while len(summary_cache) > SUMMARY_CACHE_SIZE:
+                summary_cache.popitem(last=False)
+    
+    return [summaries[key] for key in keys]
+
+def generate_summaries(texts: list[str]) -> list[str]:
+    """Summarize the beginning of several texts, batching them through the language model."""
     # Truncate input to a reasonable length (GPT-2 has a limit of 1024 tokens, but we'll be safe)
     max_input_length = 500
-    truncated_text = text[:max_input_length]
+    return _generate([text[:max_input_length] for text in texts])
+
+def generate_summary(text: str) -> str:
+    """Generate a summary of the given text using the language model."""
+    return generate_summaries([text])[0]
+
+def _is_cut_point(paragraph: str) -> bool:
+    # Content-defined boundary: depends only on the paragraph itself
+    return int(_text_key(paragraph)[:8], 16) % 4 == 0
+
+def split_into_chunks(text: str, max_tokens: int = None) -> list[str]:
+    """
+    Split text into chunks of at most max_tokens model tokens (default: the
+    backend's chunk size) along
+    paragraph boundaries. Besides the size limit, chunks also end after
+    content-defined cut-point paragraphs, so an edit only changes the chunks
+    around it and the others keep hitting the summary cache.
+    """
+    max_tokens = max_tokens or backend.chunk_tokens
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        token_ids = backend.encode(paragraph)
+        if len(token_ids) <= max_tokens:
+            pieces.append((paragraph, len(token_ids)))
+        else:
+            # Oversized paragraph: hard split on token boundaries
+            for start in range(0, len(token_ids), max_tokens):
+                window = token_ids[start:start + max_tokens]
+                pieces.append((backend.decode(window), len(window)))
     
-    # Create a prompt that encourages summarization
-    prompt = f"Summarize the following text:\n\n{truncated_text}\n\nSummary:"
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph, n_tokens in pieces:
+        if current and current_tokens + n_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += n_tokens
+        if current_tokens >= max_tokens // 2 and _is_cut_point(paragraph):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def _pack(summaries: list[str], max_tokens: int) -> list[str]:
+    """Group consecutive summaries into texts of at most max_tokens for the next reduce level."""
+    groups = []
+    current = []
+    current_tokens = 0
+    for summary in summaries:
+        n_tokens = len(backend.encode(summary))
+        if current and current_tokens + n_tokens > max_tokens:
+            groups.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(summary)
+        current_tokens += n_tokens
+    if current:
+        groups.append("\n\n".join(current))
+    if len(groups) >= len(summaries):
+        # Summaries too long to pack by budget; pair them so every level still shrinks
+        groups = ["\n\n".join(summaries[i:i + 2]) for i in range(0, len(summaries), 2)]
+    return groups
+
+def map_reduce_summaries(texts: list[str]) -> list[str]:
+    """
+    Summarize full texts hierarchically: split each into token-bounded
+    chunks, summarize every chunk, then repeatedly summarize groups of
+    summaries until one remains per text. Each level runs the pending
+    pieces of all texts through the model as one batch.
+    """
+    if not backend.load():
+        return ["Summarization model is not available."] * len(texts)
     
-    try:
-        # Generate the summary
-        result = generator(
-            prompt,
-            max_length=len(prompt.split()) + 150,  # Allow up to 150 tokens for the summary
-            num_return_sequences=1,
-            do_sample=False,
-            truncation=True
+    finals = [""] * len(texts)
+    pending = {}
+    for i, text in enumerate(texts):
+        chunks = split_into_chunks(text)
+        if chunks:
+            pending[i] = chunks
+    
+    while pending:
+        order = list(pending)
+        flat = [piece for i in order for piece in pending[i]]
+        flat_summaries = _generate(flat)
+        
+        next_pending = {}
+        offset = 0
+        for i in order:
+            summaries = flat_summaries[offset:offset + len(pending[i])]
+            offset += len(pending[i])
+            if len(summaries) == 1:
+                finals[i] = summaries[0]
+            else:
+                next_pending[i] = _pack(summaries, backend.chunk_tokens)
+        pending = next_pending
+    
+    return finals
+
+# Output formats: doc_type -> (builder, media type, download filename)
+DOC_TYPES = {
+    "pdf": (create_pdf_from_summaries, "application/pdf", "summaries.pdf"),
+    "docx": (
+        create_docx_from_summaries,
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "summaries.docx",
+    ),
+}
+
+SUMMARIZERS = {
+    "map_reduce": map_reduce_summaries,
+    "truncate": generate_summaries,
+}
+
+def _validate_request(request: SummarizationRequest):
+    """Returns an error response for an unusable request, or None."""
+    if backend.error is not None:
+        return JSONResponse(status_code=503, content={"error": "Summarization model is not available."})
+    if request.doc_type.lower() not in DOC_TYPES:
+        return JSONResponse(status_code=400, content={"error": "Invalid doc_type. Must be 'pdf' or 'docx'."})
+    if request.mode not in SUMMARIZERS:
+        return JSONResponse(status_code=400, content={"error": "Invalid mode. Must be 'map_reduce' or 'truncate'."})
+    return None
+
+# --- Job Queue ---
+
+async def _run_job(job: SummarizationJob):
+    job.status = "running"
+    request = job.request
+    summarize = SUMMARIZERS[request.mode]
+    build_document = DOC_TYPES[request.doc_type.lower()][0]
+    loop = asyncio.get_running_loop()
+    
+    # The first job after startup also pays for loading the model
+    if not await loop.run_in_executor(summary_executor, backend.load):
+        raise RuntimeError(f"Summarization model is not available: {backend.error}")
+    
+    # Summarize in batches so progress is reported per document
+    filenames = list(request.documents)
+    summaries = {}
+    for start in range(0, len(filenames), SUMMARY_BATCH_SIZE):
+        batch = filenames[start:start + SUMMARY_BATCH_SIZE]
+        for filename in batch:
+            job.documents[filename] = "running"
+        texts = await loop.run_in_executor(
+            summary_executor, summarize, [request.documents[filename] for filename in batch]
         )
-        # The generated text includes the prompt, so we extract the summary part
-        generated_text = result[0]['generated_text']
-        # Extract the summary after the "Summary:" prompt
-        if "Summary:" in generated_text:
-            summary = generated_text.split("Summary:")[-1].strip()
-        else:
-            # Fallback: take the part after the prompt
-            summary = generated_text[len(prompt):].strip()
-        return summary
-    except Exception as e:
-        print(f"Error during summary generation: {e}")
-        return "Failed to generate summary."
+        for filename, text in zip(batch, texts):
+            summaries[filename] = text
+            job.documents[filename] = "done"
+    
+    os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+    result_path = os.path.join(JOB_RESULT_DIR, f"{job.id}.{request.doc_type.lower()}")
+    await loop.run_in_executor(summary_executor, _write_document, build_document, summaries, result_path)
+    job.result_path = result_path
+    job.status = "done"
+
+async def _job_worker():
+    while True:
+        job = await job_queue.get()
+        try:
+            async with job_slots:
+                await _run_job(job)
+        except Exception as e:
+            print(f"Summarization job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            job_queue.task_done()
+
+def _ensure_job_workers():
+    """
+    Starts the job queue, its workers and the summarization slots shared
+    with the synchronous endpoint on first use, inside the server's event loop.
+    """
+    global job_queue, job_slots
+    if job_queue is None:
+        job_slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+        job_queue = asyncio.Queue(maxsize=MAX_QUEUED_JOBS)
+        for _ in range(MAX_CONCURRENT_JOBS):
+            job_workers.append(asyncio.create_task(_job_worker()))
+
+def _expire_jobs():
+    now = time.time()
+    for job_id, job in list(jobs.items()):
+        if job.finished and now - job.finished > JOB_TTL_SECONDS:
+            if job.result_path and os.path.exists(job.result_path):
+                os.unlink(job.result_path)
+            del jobs[job_id]
 
-# --- API Endpoint ---
+# --- API Endpoints ---
 
 @app.post("/summarize-and-create-document/")
 async def summarize_and_create(request: SummarizationRequest):
@@ -111,31 +437,100 @@ async def summarize_and_create(request: SummarizationRequest):
     Receives document texts, summarizes them, and returns a single
     consolidated PDF or DOCX file.
     """
-    if not generator:
-        return {"error": "Summarization model is not available."}, 503
-
-    summaries = {}
-    for filename, content in request.documents.items():
-        summary = generate_summary(content)
-        summaries[filename] = summary
-
-    if request.doc_type.lower() == 'pdf':
-        buffer = create_pdf_from_summaries(summaries)
-        media_type = "application/pdf"
-        filename = "summaries.pdf"
-    elif request.doc_type.lower() == 'docx':
-        buffer = create_docx_from_summaries(summaries)
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        filename = "summaries.docx"
-    else:
-        return {"error": "Invalid doc_type. Must be 'pdf' or 'docx'."}, 400
-
+    error = _validate_request(request)
+    if error:
+        return error
+    summarize = SUMMARIZERS[request.mode]
+    build_document, media_type, filename = DOC_TYPES[request.doc_type.lower()]
+    _ensure_job_workers()
+    
+    # Model loading, inference and document building are blocking; run them off the event loop,
+    # waiting for a free slot like queued jobs do
+    loop = asyncio.get_running_loop()
+    async with job_slots:
+        if not await loop.run_in_executor(summary_executor, backend.load):
+            return JSONResponse(status_code=503, content={"error": "Summarization model is not available."})
+        filenames = list(request.documents)
+        summary_texts = await loop.run_in_executor(
+            summary_executor, summarize, [request.documents[name] for name in filenames]
+        )
+        summaries = dict(zip(filenames, summary_texts))
+        document = await loop.run_in_executor(summary_executor, build_document, summaries)
+    size = document.seek(0, os.SEEK_END)
+    document.seek(0)
+    
     headers = {
-        'Content-Disposition': f'attachment; filename="{filename}"'
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Content-Length': str(size),
     }
+    
+    # Sent in chunks from the spooled file; the file is closed (and deleted) once sent
+    return StreamingResponse(_iter_file(document), media_type=media_type, headers=headers)
+
+@app.post("/jobs/summarize", status_code=202)
+async def submit_summarization_job(request: SummarizationRequest):
+    """
+    Queues a summarization request and returns its job id immediately.
+    Poll GET /jobs/{job_id} for progress and fetch GET /jobs/{job_id}/result when done.
+    """
+    error = _validate_request(request)
+    if error:
+        return error
+    _ensure_job_workers()
+    _expire_jobs()
+    
+    job = SummarizationJob(request)
+    try:
+        job_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        return JSONResponse(status_code=429, content={"error": "Too many queued jobs. Retry later."})
+    jobs[job.id] = job
+    return {"job_id": job.id, "status": job.status, "queue_position": job_queue.qsize()}
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Reports overall status and per-document progress of a job."""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'."})
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Serves the finished PDF/DOCX of a completed job."""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'."})
+    if job.status == "failed":
+        return JSONResponse(status_code=500, content={"error": job.error})
+    if job.status != "done":
+        return JSONResponse(status_code=409, content={"error": f"Job is {job.status}.", **job.to_dict()})
+    
+    _, media_type, filename = DOC_TYPES[job.request.doc_type.lower()]
+    return FileResponse(job.result_path, media_type=media_type, filename=filename)
+
+@app.post("/warmup")
+async def warm_up():
+    """
+    Loads the model if it isn't loaded yet and waits until it is ready.
+    A previously failed load is retried.
+    """
+    if backend.error is not None:
+        backend.reset()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(summary_executor, backend.load)
+    return await readiness_check()
 
-    return StreamingResponse(buffer, media_type=media_type, headers=headers)
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the model is loaded, 503 until then."""
+    state = backend.state()
+    content = {"status": state, "backend": backend.name}
+    if state == "failed":
+        content["error"] = backend.error
+    return JSONResponse(status_code=200 if state == "ready" else 503, content=content)
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok" if generator else "degraded"}
\ No newline at end of file
+    """Liveness probe: the process is up and serving; doesn't load the model."""
+    return {"status": "ok", "model": backend.state()}
\ No newline at end of file
@@ -1,8 +1,11 @@
 # models.py
 from langchain_community.llms import OpenAI
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from embedding_cache import CachedEmbeddings
+from http_client import get_httpx_client, list_models, models_url
 import requests
 import os
+import threading
 from pathlib import Path
 
 # Default configuration (can be overridden by environment variables or GUI)
@@ -14,44 +17,126 @@ DEFAULT_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "llama-3.2-1b-instruct")
 EMBEDDING_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
 HF_CACHE = os.getenv("HF_HOME", os.path.expanduser("~/.cache/huggingface"))
 
-def _find_local_model_path():
+# Disk-backed cache of chunk embeddings (set EMBEDDING_CACHE=0 to disable)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") != "0"
+
+# Load the embedding model in the background at startup (set EMBEDDING_WARMUP=0 to disable)
+EMBEDDING_WARMUP_ENABLED = os.getenv("EMBEDDING_WARMUP", "1") != "0"
+
+# Embedding execution settings (tune ingestion throughput, especially on CPU-only nodes)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = torch default
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "fp32")  # fp32 | fp16 | bf16 (GPU only)
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "none")  # none | int8 (CPU only)
+
+# Unit-length embeddings: indexes use inner product, so scores are cosine similarities
+EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "0") == "1"
+
+# Process-wide registry: one loaded encoder per (model id, device), shared by all sessions
+_EMBEDDING_MODELS = {}
+_EMBEDDING_MODELS_LOCK = threading.Lock()
+# (model id, device) -> numeric format the loaded encoder runs in: fp32 | fp16 | bf16 | int8
+_EMBEDDING_PRECISIONS = {}
+
+# model id -> snapshot directory found in the HF cache
+_LOCAL_MODEL_PATHS = {}
+_LOCAL_MODEL_PATHS_LOCK = threading.Lock()
+
+# LLM clients shared by all sessions, keyed by (api base, api key, model name)
+_LLM_CLIENTS = {}
+_LLM_CLIENTS_LOCK = threading.Lock()
+
+def find_local_model_path(model_id=EMBEDDING_MODEL_ID):
     """Find pre-downloaded model in HF cache."""
+    # Found paths are remembered; misses are re-checked so a model downloaded later is picked up
+    with _LOCAL_MODEL_PATHS_LOCK:
+        cached = _LOCAL_MODEL_PATHS.get(model_id)
+    if cached is not None and os.path.isdir(cached):
+        return cached
+    
     cache_dir = Path(HF_CACHE) / "hub"
     if not cache_dir.exists():
         return None
     # Look for the model snapshot - match directory name exactly (no trailing --)
-    model_name_safe = EMBEDDING_MODEL_ID.replace('/', '--')
+    model_name_safe = model_id.replace('/', '--')
     model_dirs = list(cache_dir.glob(f"models--{model_name_safe}*"))
     for model_dir in model_dirs:
         snapshots = list((model_dir / "snapshots").glob("*"))
         if snapshots:
+            with _LOCAL_MODEL_PATHS_LOCK:
+                _LOCAL_MODEL_PATHS[model_id] = str(snapshots[0])
             return str(snapshots[0])
     return None
 
-def get_embedding_model():
-    """Initializes the embedding model from local cache, no download."""
+def is_model_cached(model_id=EMBEDDING_MODEL_ID):
+    """True if the model has been downloaded to the local HF cache."""
+    return find_local_model_path(model_id) is not None
+
+def detect_device():
+    """Auto-detect device: CUDA > MPS > CPU."""
     import torch
     
-    # Auto-detect device: CUDA > MPS > CPU
     if torch.cuda.is_available():
-        device = "cuda"
+        return "cuda"
     elif torch.backends.mps.is_available():
-        device = "mps"
-    else:
-        device = "cpu"
+        return "mps"
+    return "cpu"
+
+def _apply_execution_settings(embeddings, device):
+    """
+    Applies thread count, reduced precision or int8 quantization to a loaded
+    encoder. Returns the numeric format it ended up in (fp32 | fp16 | bf16 | int8).
+    """
+    import torch
     
-    encode_kwargs = {'normalize_embeddings': False}
+    try:
+        if device == "cpu":
+            if EMBEDDING_THREADS > 0:
+                torch.set_num_threads(EMBEDDING_THREADS)
+            if EMBEDDING_QUANTIZE == "int8":
+                # Dynamic int8 quantization of the Linear layers: ~2-3x faster on CPU
+                embeddings.client = torch.quantization.quantize_dynamic(
+                    embeddings.client, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                return "int8"
+        elif EMBEDDING_PRECISION == "fp16":
+            embeddings.client.half()
+            return "fp16"
+        elif EMBEDDING_PRECISION == "bf16":
+            embeddings.client.to(torch.bfloat16)
+            return "bf16"
+    except Exception as e:
+        # Fall back to the full-precision model rather than failing the load
+        print(f"Could not apply embedding execution settings: {e}")
+    return "fp32"
+
+def _load_embedding_model(model_id, device):
+    """Loads the embedding model from local cache, no download. Returns (embeddings, precision)."""
+    # sentence-transformers sorts each encode() call by text length before batching,
+    # so padding stays low as long as a whole file's chunks go through one call
+    encode_kwargs = {'normalize_embeddings': EMBEDDING_NORMALIZE, 'batch_size': EMBEDDING_BATCH_SIZE}
     
     # Try to load from local cache first
-    local_path = _find_local_model_path()
+    local_path = find_local_model_path(model_id)
     if local_path:
         try:
             model_kwargs = {'device': device}
-            return HuggingFaceEmbeddings(
+            embeddings = HuggingFaceEmbeddings(
                 model_name=local_path,
                 model_kwargs=model_kwargs,
                 encode_kwargs=encode_kwargs
             )
+            precision = _apply_execution_settings(embeddings, device)
+            if EMBEDDING_CACHE_ENABLED:
+                # Key on the model id, not the snapshot path, so the cache survives cache moves;
+                # normalized and reduced-precision vectors differ, so they get their own keys
+                cache_id = model_id
+                if EMBEDDING_NORMALIZE:
+                    cache_id += ":normalized"
+                if precision != "fp32":
+                    cache_id += f":{precision}"
+                return CachedEmbeddings(embeddings, model_id=cache_id), precision
+            return embeddings, precision
         except Exception as e:
             # If local load fails, fall through to error
             pass
@@ -61,17 +146,87 @@ def get_embedding_model():
         f"Embedding model not found in local cache ({HF_CACHE}).\n"
         f"Pre-download it first:\n"
         f"  python -c \"from sentence_transformers import SentenceTransformer; "
-        f"SentenceTransformer('{EMBEDDING_MODEL_ID}')\"\n"
+        f"SentenceTransformer('{model_id}')\"\n"
         f"Or set HF_HOME to your cache directory."
     )
 
+def get_embedding_model(model_id=EMBEDDING_MODEL_ID, device=None):
+    """
+    Returns the shared embedding model for model_id/device, loading it from
+    local cache on first use. Every caller in the process gets the same instance.
+    """
+    device = device or detect_device()
+    key = (model_id, device)
+    
+    model = _EMBEDDING_MODELS.get(key)
+    if model is not None:
+        return model
+    
+    with _EMBEDDING_MODELS_LOCK:
+        # Another thread may have finished loading while we waited
+        if key not in _EMBEDDING_MODELS:
+            embeddings, _EMBEDDING_PRECISIONS[key] = _load_embedding_model(model_id, device)
+            _EMBEDDING_MODELS[key] = embeddings
+        return _EMBEDDING_MODELS[key]
+
+def get_embedding_precision(model_id=EMBEDDING_MODEL_ID, device=None):
+    """
+    Numeric format (fp32 | fp16 | bf16 | int8) of the shared embedding model,
+    loading it if needed. Vectors from different formats don't mix in one index.
+    """
+    device = device or detect_device()
+    get_embedding_model(model_id, device)
+    return _EMBEDDING_PRECISIONS[(model_id, device)]
+
+def is_embedding_model_loaded(model_id=EMBEDDING_MODEL_ID, device=None):
+    """True if the shared embedding model is already in memory."""
+    return (model_id, device or detect_device()) in _EMBEDDING_MODELS
+
+def unload_embedding_model(model_id=EMBEDDING_MODEL_ID, device=None):
+    """
+    Drops the shared embedding model, so the next get_embedding_model()
+    loads it from the local cache again. Callers still holding the old
+    instance keep using it until they fetch the model again.
+    """
+    key = (model_id, device or detect_device())
+    with _EMBEDDING_MODELS_LOCK:
+        _EMBEDDING_MODELS.pop(key, None)
+        _EMBEDDING_PRECISIONS.pop(key, None)
+
+def warm_up_embedding_model(model_id=EMBEDDING_MODEL_ID):
+    """
+    Loads the shared embedding model in a background thread and runs one
+    encode so the first real request doesn't pay for lazy initialization.
+    Returns the thread; load errors are left for get_embedding_model() to report.
+    """
+    def _warm_up():
+        try:
+            get_embedding_model(model_id).embed_query("warm-up")
+        except Exception as e:
+            print(f"Embedding model warm-up failed: {e}")
+    
+    thread = threading.Thread(target=_warm_up, name="embedding-warm-up", daemon=True)
+    thread.start()
+    return thread
+
 def get_llm(api_base=None, api_key=None, model_name=None):
-    """Initializes the LLM with configurable parameters."""
-    return OpenAI(
-        openai_api_key=api_key or DEFAULT_API_KEY,
-        openai_api_base=api_base or DEFAULT_API_BASE,
-        model_name=model_name or DEFAULT_MODEL_NAME,
-    )
+    """
+    Initializes the LLM with configurable parameters. Clients are shared per
+    (endpoint, key, model) and all use the pooled HTTP client, so
+    connections are reused across sessions.
+    """
+    key = (api_base or DEFAULT_API_BASE, api_key or DEFAULT_API_KEY, model_name or DEFAULT_MODEL_NAME)
+    with _LLM_CLIENTS_LOCK:
+        llm = _LLM_CLIENTS.get(key)
+        if llm is None:
+            llm = OpenAI(
+                openai_api_base=key[0],
+                openai_api_key=key[1],
+                model_name=key[2],
+                http_client=get_httpx_client(),
+            )
+            _LLM_CLIENTS[key] = llm
+        return llm
 
 def verify_llm_model_availability(llm_client: OpenAI):
     """
@@ -80,16 +235,15 @@ def verify_llm_model_availability(llm_client: OpenAI):
     """
     model_to_check = llm_client.model_name
     api_base = llm_client.openai_api_base
-    
-    # Construct the correct URL for the /models endpoint
-    models_url = api_base.replace("/v1", "") + "/v1/models"
+    api_key = llm_client.openai_api_key
+    if hasattr(api_key, "get_secret_value"):
+        api_key = api_key.get_secret_value()
     
     try:
-        response = requests.get(models_url, timeout=10)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-        
-        available_models = response.json().get("data", [])
-        available_model_ids = [model.get("id") for model in available_models]
+        available_model_ids = list_models(api_base, api_key)
+        if model_to_check not in available_model_ids:
+            # The listing may be cached from before the model was loaded; ask again
+            available_model_ids = list_models(api_base, api_key, refresh=True)
         
         if model_to_check not in available_model_ids:
             # Provide a helpful error message if the model is not in the list
@@ -102,7 +256,7 @@ def verify_llm_model_availability(llm_client: OpenAI):
     except requests.exceptions.RequestException as e:
         # Catch any network errors (connection, timeout, etc.)
         raise ConnectionError(
-            f"Failed to connect to the LLM API at {models_url}. "
+            f"Failed to connect to the LLM API at {models_url(api_base)}. "
             "Please ensure the server is running and accessible."
         ) from e
     except Exception as e:
@@ -1,45 +1,177 @@
 from langchain_community.vectorstores import Chroma
 from langchain_classic.chains import ConversationalRetrievalChain
-from langchain_classic.memory import ConversationBufferMemory
-from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader, CSVLoader, UnstructuredExcelLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from models import get_llm, get_embedding_model
+from langchain_classic.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+from models import get_llm, get_embedding_model, get_embedding_precision, EMBEDDING_MODEL_ID, EMBEDDING_NORMALIZE
+from knowledge_base import CHUNK_SIZE, CHUNK_OVERLAP, file_hash, read_manifest, write_manifest
+from ingest import ingest_files
+from chat_memory import BackgroundSummaryMemory, CachedLLMChain
+from context_packer import CONTEXT_FETCH_K, CONTEXT_PACKING, ContextPackingRetriever
 import os
+import re
 import requests
+import threading
+from collections import OrderedDict
 
 from langchain_classic.retrievers.self_query.base import SelfQueryRetriever
 from langchain_classic.chains.query_constructor.base import AttributeInfo
 from langchain_core.prompts import PromptTemplate
 
-def create_rag_chain(file_paths):
-    docs = []
-    for path in file_paths:
-        file_ext = os.path.splitext(path)[1].lower()
+QA_PROMPT = PromptTemplate(
+    template="""Use the following pieces of context to answer the question at the end. 
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Answer:""",
+    input_variables=["context", "question"],
+)
+
+def stream_answer(llm, retriever, question, prompt=QA_PROMPT):
+    """
+    Retrieves context for question and streams the answer from the LLM.
+    
+    Returns (sources, tokens): the retrieved documents, available before
+    generation starts, and an iterator over answer text chunks as the
+    OpenAI-compatible endpoint produces them.
+    """
+    sources = retriever.invoke(question)
+    context = "\n\n".join(doc.page_content for doc in sources)
+    return sources, llm.stream(prompt.format(context=context, question=question))
+
+# Any "something.ext" that looks like a filename, known or not
+_FILENAME_PATTERN = re.compile(r"\b[\w.-]+\.(?:pdf|docx?|txt|csv|xlsx?)\b", re.IGNORECASE)
+
+def mentions_source(query, sources):
+    """
+    True if the question plausibly refers to a specific file: it contains a
+    filename, or the name of a known source with or without its extension
+    (underscores/dashes may be written as spaces).
+    """
+    if _FILENAME_PATTERN.search(query):
+        return True
+    text = query.lower()
+    for source in sources:
+        stem = os.path.splitext(source)[0].lower()
+        # Very short stems ("a", "v2") would match ordinary words
+        if len(stem) < 3:
+            continue
+        for candidate in (stem, re.sub(r"[_\-.]+", " ", stem)):
+            if re.search(rf"(?<!\w){re.escape(candidate)}(?!\w)", text):
+                return True
+    return False
+
+class MetadataRoutedRetriever(BaseRetriever):
+    """
+    Routes around the self-query LLM call when no metadata filter is needed.
+    
+    Questions that don't mention a known source file go straight to similarity
+    search; only the rest pay for the query-constructor LLM call. Constructed
+    queries are kept in a small LRU cache so repeated questions skip it too.
+    """
+    
+    self_query_retriever: SelfQueryRetriever
+    sources: list[str]
+    cache_size: int = 256
+    
+    _query_cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _cache_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        self_query = self.self_query_retriever
+        if not mentions_source(query, self.sources):
+            return self_query._get_docs_with_query(query, dict(self_query.search_kwargs))
         
-        if file_ext == ".pdf":
-            loader = PyMuPDFLoader(path)
-        elif file_ext == ".docx":
-            loader = Docx2txtLoader(path)
-        elif file_ext == ".txt":
-            loader = TextLoader(path, autodetect_encoding=True)
-        elif file_ext == ".csv":
-            loader = CSVLoader(path)
-        elif file_ext in [".xls", ".xlsx"]:
-            loader = UnstructuredExcelLoader(path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_ext}")
+        key = query.strip()
+        with self._cache_lock:
+            structured_query = self._query_cache.get(key)
+            if structured_query is not None:
+                self._query_cache.move_to_end(key)
+        if structured_query is None:
+            structured_query = self_query.query_constructor.invoke(
+                {"query": query}, config={"callbacks": run_manager.get_child()}
+            )
+            with self._cache_lock:
+                self._query_cache[key] = structured_query
+                if len(self._query_cache) > self.cache_size:
+                    self._query_cache.popitem(last=False)
         
-        loaded_docs = loader.load()
-        for doc in loaded_docs:
-            doc.metadata["source"] = os.path.basename(path)
-        docs.extend(loaded_docs)
+        new_query, search_kwargs = self_query._prepare_query(query, structured_query)
+        return self_query._get_docs_with_query(new_query, search_kwargs)
+
+def _chroma_manifest(file_paths):
+    """Describes what a persisted Chroma store was built from."""
+    files = {}
+    for path in file_paths:
+        with open(path, "rb") as f:
+            files[os.path.basename(path)] = file_hash(f.read())
+    return {
+        "embedding_model_id": EMBEDDING_MODEL_ID,
+        "embedding_precision": get_embedding_precision(),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "normalized": EMBEDDING_NORMALIZE,
+        "files": files,
+    }
+
+def create_rag_chain(file_paths, persist_directory=None):
+    """
+    Builds the conversational RAG chain over file_paths.
     
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(docs)
+    With persist_directory set, the Chroma store is saved there along with a
+    manifest of source file hashes, chunking params and embedding model id.
+    A later call with the same files reopens it instead of re-ingesting; the
+    returned docs are then the stored chunks rather than the parsed pages.
+    """
+    embedding_model = get_embedding_model()
+    # Normalized embeddings: inner-product space, so Chroma's scores are cosine similarities
+    collection_metadata = {"hnsw:space": "ip"} if EMBEDDING_NORMALIZE else None
     
-    vectorstore = Chroma.from_documents(chunks, get_embedding_model())
+    manifest = _chroma_manifest(file_paths) if persist_directory else None
+    if persist_directory and read_manifest(persist_directory) == manifest:
+        vectorstore = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embedding_model,
+            collection_metadata=collection_metadata,
+        )
+        stored = vectorstore.get(include=["documents", "metadatas"])
+        docs = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(stored["documents"], stored["metadatas"])
+        ]
+    else:
+        # Parse and chunk all files concurrently
+        docs = []
+        chunks = []
+        for result in ingest_files(file_paths, keep_documents=True):
+            if result.error:
+                raise ValueError(f"Failed to load {result.source}: {result.error}")
+            docs.extend(result.documents)
+            chunks.extend(result.chunks)
+        
+        if persist_directory:
+            # Start from an empty collection so stale chunks don't linger
+            if os.path.isdir(persist_directory):
+                write_manifest(persist_directory, {})
+                Chroma(persist_directory=persist_directory, embedding_function=embedding_model).delete_collection()
+            os.makedirs(persist_directory, exist_ok=True)
+            vectorstore = Chroma.from_documents(
+                chunks, embedding_model,
+                persist_directory=persist_directory,
+                collection_metadata=collection_metadata,
+            )
+            write_manifest(persist_directory, manifest)
+        else:
+            vectorstore = Chroma.from_documents(chunks, embedding_model, collection_metadata=collection_metadata)
+    
+    llm = get_llm()
     
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # History is capped by token budget; older turns are summarized in the background
+    memory = BackgroundSummaryMemory(llm=llm, memory_key="chat_history", return_messages=True)
     
     metadata_field_info = [
         AttributeInfo(
@@ -50,14 +182,22 @@ def create_rag_chain(file_paths):
     ]
     document_content_description = "The textual content of a document."
     
-    llm = get_llm()
-    retriever = SelfQueryRetriever.from_llm(
+    self_query_retriever = SelfQueryRetriever.from_llm(
         llm,
         vectorstore,
         document_content_description,
         metadata_field_info,
-        verbose=True
+        verbose=True,
+        # Over-fetch; the context packer keeps what fits the token budget
+        search_kwargs={"k": CONTEXT_FETCH_K} if CONTEXT_PACKING else {},
+    )
+    # Only build a structured query when the question names one of these files
+    retriever = MetadataRoutedRetriever(
+        self_query_retriever=self_query_retriever,
+        sources=sorted({doc.metadata["source"] for doc in docs if "source" in doc.metadata}),
     )
+    if CONTEXT_PACKING:
+        retriever = ContextPackingRetriever(base_retriever=retriever, model_name=llm.model_name)
     
     prompt_template = """You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Do not make up an answer.
     Context: {context}
@@ -72,5 +212,7 @@ def create_rag_chain(file_paths):
         memory=memory,
         combine_docs_chain_kwargs={"prompt": PROMPT}
     )
+    # Reuse the condensed standalone question for a repeated question and history
+    chain.question_generator = CachedLLMChain(llm=llm, prompt=CONDENSE_QUESTION_PROMPT)
     
     return chain, docs
\ No newline at end of file
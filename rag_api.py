@@ -0,0 +1,354 @@
+# rag_api.py
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from answer_cache import get_answer_cache
+from ingest import SUPPORTED_EXTENSIONS, ingest_files
+from knowledge_base import (
+    KnowledgeBase,
+    StaleKnowledgeBaseError,
+    close_knowledge_base,
+    file_hash,
+    list_knowledge_bases,
+    open_knowledge_base,
+)
+from models import (
+    EMBEDDING_MODEL_ID,
+    EMBEDDING_NORMALIZE,
+    EMBEDDING_WARMUP_ENABLED,
+    get_embedding_model,
+    get_embedding_precision,
+    get_llm,
+    warm_up_embedding_model,
+)
+from rag import stream_answer
+from reranker import RERANK_ENABLED, reranking_retriever
+from context_packer import CONTEXT_FETCH_K, CONTEXT_PACKING, ContextPackingRetriever
+
+# --- App Initialization ---
+
+@asynccontextmanager
+async def lifespan(app):
+    if EMBEDDING_WARMUP_ENABLED:
+        warm_up_embedding_model()
+    yield
+
+
+app = FastAPI(
+    title="ChatRAG API",
+    description="Headless ingestion, retrieval and question answering over saved knowledge bases.",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+
+def _open_knowledge_base(name: str):
+    """The shared KnowledgeBase for name and its lock, loaded from disk or created on first use."""
+    return open_knowledge_base(
+        name, get_embedding_model(), EMBEDDING_MODEL_ID,
+        normalized=EMBEDDING_NORMALIZE, precision=get_embedding_precision(),
+    )
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"error": message})
+
+
+def _check_name(name: str, must_exist: bool = True) -> Optional[JSONResponse]:
+    """Returns an error response for an invalid or (if must_exist) unknown knowledge base name, or None."""
+    try:
+        exists = KnowledgeBase.exists(name)
+    except ValueError as e:
+        return _error(400, str(e))
+    if must_exist and not exists:
+        return _error(404, f"Unknown knowledge base '{name}'.")
+    return None
+
+
+def _source_dict(doc) -> dict:
+    return {"content": doc.page_content, "metadata": doc.metadata}
+
+
+# --- Pydantic Models for Request Body ---
+
+class QueryRequest(BaseModel):
+    question: str = Field(..., description="The question to retrieve context for.")
+    k: int = Field(3, ge=1, le=50, description="Number of chunks to retrieve.")
+
+
+class AnswerRequest(QueryRequest):
+    stream: bool = Field(False, description="Stream the answer as NDJSON events instead of one JSON response.")
+    use_cache: bool = Field(True, description="Reuse a cached answer to the same or a near-duplicate question.")
+
+
+# --- Blocking work, run in the threadpool ---
+
+def _save(name: str, knowledge_base):
+    try:
+        knowledge_base.save()
+    except StaleKnowledgeBaseError:
+        # Another process saved it: drop this copy so the next request reloads from disk
+        close_knowledge_base(name)
+        raise
+
+
+def _ingest(name: str, uploads: list[tuple[str, bytes]]) -> dict:
+    knowledge_base, lock = _open_knowledge_base(name)
+    pending = {}
+    skipped = []
+    for filename, data in uploads:
+        content_hash = file_hash(data)
+        if knowledge_base.has_file(filename, content_hash):
+            skipped.append(filename)
+        else:
+            pending[filename] = (data, content_hash)
+
+    # Parse/chunk in parallel and embed each file's chunks as soon as it is ready. None of
+    # this touches the index, so queries on the knowledge base keep running meanwhile
+    results = []
+    embedded = []
+    for result in ingest_files(
+        [data for data, _ in pending.values()],
+        sources=list(pending),
+        chunk_size=knowledge_base.chunk_size,
+        chunk_overlap=knowledge_base.chunk_overlap,
+    ):
+        if result.error:
+            results.append({"file": result.source, "error": result.error})
+            continue
+        embed_start = time.perf_counter()
+        vectors = knowledge_base.embed_chunks(result.chunks)
+        entry = {
+            "file": result.source,
+            "chunks": 0,
+            "parse_seconds": round(result.parse_seconds, 3),
+            "split_seconds": round(result.split_seconds, 3),
+            "embed_seconds": round(time.perf_counter() - embed_start, 3),
+        }
+        embedded.append((result, vectors, entry))
+        results.append(entry)
+
+    # Only adding the vectors and saving need the index to themselves
+    lock.acquire_write()
+    try:
+        for result, vectors, entry in embedded:
+            entry["chunks"] = knowledge_base.add_file(
+                result.source, pending[result.source][1], result.chunks, vectors,
+            )
+        if knowledge_base.dirty:
+            _save(name, knowledge_base)
+        return {
+            "knowledge_base": name,
+            "version": knowledge_base.version,
+            "chunk_count": knowledge_base.chunk_count,
+            "files": results,
+            "unchanged": skipped,
+        }
+    finally:
+        lock.release_write()
+
+
+def _remove(name: str, filename: str) -> Optional[int]:
+    knowledge_base, lock = _open_knowledge_base(name)
+    lock.acquire_write()
+    try:
+        if filename not in knowledge_base.files:
+            return None
+        removed = knowledge_base.remove_file(filename)
+        if knowledge_base.dirty:
+            _save(name, knowledge_base)
+        return removed
+    finally:
+        lock.release_write()
+
+
+def _describe(name: str) -> dict:
+    knowledge_base, lock = _open_knowledge_base(name)
+    # files is changed in place by concurrent ingestion and removal
+    lock.acquire_read()
+    try:
+        return {
+            "name": name,
+            "version": knowledge_base.version,
+            "index_type": knowledge_base.current_index_type,
+            "chunk_count": knowledge_base.chunk_count,
+            "files": {filename: entry["hash"] for filename, entry in knowledge_base.files.items()},
+        }
+    finally:
+        lock.release_read()
+
+
+def _version(name: str):
+    """The shared KnowledgeBase for name and its version, read under the read lock."""
+    knowledge_base, lock = _open_knowledge_base(name)
+    lock.acquire_read()
+    try:
+        return knowledge_base, knowledge_base.version
+    finally:
+        lock.release_read()
+
+
+def _retrieve(name: str, request: QueryRequest, llm=None):
+    """
+    Runs retrieval under the read lock and returns (sources, tokens,
+    rerank_ms). With an llm, tokens is stream_answer's stream; generation
+    then proceeds without holding the lock. rerank_ms is None when
+    reranking is off.
+    """
+    knowledge_base, lock = _open_knowledge_base(name)
+    # Answers pack as many candidates as fit the context token budget
+    pack = llm is not None and CONTEXT_PACKING
+    k = max(request.k, CONTEXT_FETCH_K) if pack else request.k
+    lock.acquire_read()
+    try:
+        if RERANK_ENABLED:
+            retriever = reranking_retriever(knowledge_base, k)
+        else:
+            retriever = knowledge_base.as_retriever(search_kwargs={"k": k})
+        rerank_stage = retriever
+        if pack:
+            retriever = ContextPackingRetriever(base_retriever=retriever, model_name=llm.model_name)
+        if llm is None:
+            sources, tokens = retriever.invoke(request.question), None
+        else:
+            sources, tokens = stream_answer(llm, retriever, request.question)
+        return sources, tokens, getattr(rerank_stage, "last_latency_ms", None)
+    finally:
+        lock.release_read()
+
+
+# --- API Endpoints ---
+
+@app.get("/kb")
+def list_kbs():
+    """Knowledge bases saved on disk."""
+    return {"knowledge_bases": list_knowledge_bases()}
+
+
+@app.get("/kb/{name}")
+async def describe_kb(name: str):
+    """Version, index type, chunk count and files of a knowledge base."""
+    error = _check_name(name)
+    if error:
+        return error
+    return await run_in_threadpool(_describe, name)
+
+
+@app.post("/kb/{name}/ingest")
+async def ingest(name: str, files: list[UploadFile] = File(...)):
+    """
+    Adds uploaded files to a knowledge base (created if needed) and saves it.
+    Files already indexed with the same content are skipped.
+    """
+    error = _check_name(name, must_exist=False)
+    if error:
+        return error
+    uploads = []
+    for upload in files:
+        if not upload.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            return _error(400, f"Unsupported file type: {upload.filename}")
+        uploads.append((upload.filename, await upload.read()))
+    try:
+        return await run_in_threadpool(_ingest, name, uploads)
+    except StaleKnowledgeBaseError as e:
+        return _error(409, str(e))
+
+
+@app.delete("/kb/{name}/files/{filename}")
+async def remove_file(name: str, filename: str):
+    """Removes one file's chunks from a knowledge base."""
+    error = _check_name(name)
+    if error:
+        return error
+    try:
+        removed = await run_in_threadpool(_remove, name, filename)
+    except StaleKnowledgeBaseError as e:
+        return _error(409, str(e))
+    if removed is None:
+        return _error(404, f"File '{filename}' is not in knowledge base '{name}'.")
+    return {"knowledge_base": name, "file": filename, "removed_chunks": removed}
+
+
+@app.post("/kb/{name}/query")
+async def query(name: str, request: QueryRequest):
+    """Retrieves the chunks most relevant to a question, without calling the LLM."""
+    error = _check_name(name)
+    if error:
+        return error
+    try:
+        sources, _, rerank_ms = await run_in_threadpool(_retrieve, name, request)
+    except ValueError as e:
+        return _error(400, str(e))
+    except RuntimeError as e:
+        # Reranker model missing from the local cache
+        return _error(503, str(e))
+    return {"sources": [_source_dict(doc) for doc in sources], "rerank_ms": rerank_ms}
+
+
+@app.post("/kb/{name}/answer")
+async def answer(name: str, request: AnswerRequest):
+    """
+    Answers a question from a knowledge base with the configured LLM.
+
+    With stream=true the response is NDJSON: a {"sources": [...]} event,
+    then {"token": "..."} events as the LLM produces them, then
+    {"done": true, "cached": ...}.
+    """
+    error = _check_name(name)
+    if error:
+        return error
+    knowledge_base, kb_version = await run_in_threadpool(_version, name)
+    llm = get_llm()
+
+    # Same question (or a near-duplicate) on the same documents and model: skip the LLM
+    answer_cache = get_answer_cache()
+    # k changes which chunks the answer is based on, so answers for different k aren't interchangeable
+    cache_version = f"{kb_version}:{llm.model_name}:{request.k}"
+    query_vector = await run_in_threadpool(knowledge_base.embeddings.embed_query, request.question)
+    cached = answer_cache.lookup(cache_version, query_vector) if request.use_cache else None
+
+    if cached is not None:
+        sources, tokens, rerank_ms = cached.sources, iter([cached.answer]), None
+    else:
+        try:
+            sources, tokens, rerank_ms = await run_in_threadpool(_retrieve, name, request, llm)
+        except ValueError as e:
+            return _error(400, str(e))
+        except RuntimeError as e:
+            return _error(503, str(e))
+
+    if not request.stream:
+        text = cached.answer if cached is not None else await run_in_threadpool(lambda: "".join(tokens))
+        if cached is None:
+            answer_cache.store(cache_version, request.question, query_vector, text, sources)
+        return {
+            "answer": text,
+            "sources": [_source_dict(doc) for doc in sources],
+            "cached": cached is not None,
+            "rerank_ms": rerank_ms,
+        }
+
+    def events():
+        yield json.dumps({"sources": [_source_dict(doc) for doc in sources], "rerank_ms": rerank_ms}) + "\n"
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            yield json.dumps({"token": token}) + "\n"
+        if cached is None:
+            answer_cache.store(cache_version, request.question, query_vector, "".join(parts), sources)
+        yield json.dumps({"done": True, "cached": cached is not None}) + "\n"
+
+    # A sync generator: Starlette iterates it in the threadpool, so the LLM stream never blocks the loop
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok"}
@@ -0,0 +1,114 @@
+# reranker.py
+import os
+import threading
+import time
+from collections import deque
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from models import HF_CACHE, detect_device, find_local_model_path
+
+# Rerank retrieved chunks with a cross-encoder before they reach the prompt (off by default)
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL_ID = os.getenv("RERANK_MODEL_ID", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched from the index and scored per query
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+# Process-wide registry: one loaded cross-encoder per (model id, device)
+_RERANKERS = {}
+_RERANKERS_LOCK = threading.Lock()
+
+
+def get_reranker(model_id=RERANK_MODEL_ID, device=None):
+    """
+    Returns the shared cross-encoder for model_id, loading it from the local
+    HF cache on first use. Like the embedding model, it is never downloaded.
+    """
+    device = device or detect_device()
+    key = (model_id, device)
+    with _RERANKERS_LOCK:
+        if key not in _RERANKERS:
+            local_path = find_local_model_path(model_id)
+            if not local_path:
+                raise RuntimeError(
+                    f"Reranker model not found in local cache ({HF_CACHE}).\n"
+                    f"Pre-download it first:\n"
+                    f"  python -c \"from sentence_transformers import CrossEncoder; "
+                    f"CrossEncoder('{model_id}')\""
+                )
+            from sentence_transformers import CrossEncoder
+
+            _RERANKERS[key] = CrossEncoder(local_path, device=device, max_length=512)
+        return _RERANKERS[key]
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Over-fetches candidates from base_retriever, scores each (query, chunk)
+    pair with a cross-encoder in batches and returns the best k, with the
+    score in metadata["rerank_score"].
+
+    Reranking time is recorded per query: last_latency_ms, plus stats() over
+    recent queries, to help size RERANK_FETCH_K.
+    """
+
+    base_retriever: BaseRetriever
+    reranker: object
+    k: int = 3
+    batch_size: int = RERANK_BATCH_SIZE
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    last_latency_ms: float = 0.0
+    last_candidates: int = 0
+    _latencies: deque = PrivateAttr(default_factory=lambda: deque(maxlen=1000))
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        candidates = self.base_retriever.invoke(query)
+        if not candidates:
+            return []
+
+        start = time.perf_counter()
+        scores = self.reranker.predict(
+            [(query, doc.page_content) for doc in candidates],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.last_latency_ms = elapsed_ms
+            self.last_candidates = len(candidates)
+            self._latencies.append(elapsed_ms)
+
+        ranked = sorted(zip(candidates, scores), key=lambda pair: pair[1], reverse=True)
+        # Copies, so scores don't leak into the shared docstore documents
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": float(score)})
+            for doc, score in ranked[:self.k]
+        ]
+
+    def stats(self) -> dict:
+        """Reranking latency over recent queries."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {"queries": 0, "mean_ms": 0.0, "p95_ms": 0.0}
+        return {
+            "queries": len(latencies),
+            "mean_ms": sum(latencies) / len(latencies),
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        }
+
+
+def reranking_retriever(knowledge_base, k: int, fetch_k: int = RERANK_FETCH_K) -> RerankingRetriever:
+    """A knowledge base retriever that fetches fetch_k candidates and keeps the k best after reranking."""
+    return RerankingRetriever(
+        base_retriever=knowledge_base.as_retriever(search_kwargs={"k": max(k, fetch_k)}),
+        reranker=get_reranker(),
+        k=k,
+    )
@@ -0,0 +1,190 @@
+# sparse_index.py
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+# Fuse BM25 keyword results with dense results (set HYBRID_SEARCH=0 for dense only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+# Candidates taken from each side before fusion
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+# Reciprocal rank fusion constant: larger values flatten the rank weighting
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Dense (FAISS, GIL released) and sparse searches of one query run side by side here
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-search")
+
+# Words and identifiers such as "E-1042", "AB12/C" or "v2.3.1"
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased terms. Compound identifiers are kept whole, so an exact part
+    number or error code matches strongly, and are also indexed by their
+    parts.
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = re.split(r"[-_./:]", token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """
+    In-memory inverted index scoring chunks with Okapi BM25.
+
+    Chunks are added and removed by doc id (the same ids as the FAISS
+    docstore), so it is updated per file alongside the vector index.
+    """
+
+    def __init__(self):
+        # term -> {doc id: term frequency}
+        self.postings = {}
+        # doc id -> number of terms
+        self.doc_lengths = {}
+        # doc id -> its distinct terms, so removal only visits that document's postings
+        self.doc_terms = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "doc_terms" not in state:
+            # Pickled before doc_terms existed: derive it from the postings
+            self.doc_terms = {}
+            for term, docs in self.postings.items():
+                for doc_id in docs:
+                    self.doc_terms.setdefault(doc_id, []).append(term)
+
+    def add(self, doc_ids, texts):
+        for doc_id, text in zip(doc_ids, texts):
+            if doc_id in self.doc_lengths:
+                self.remove([doc_id])
+            terms = Counter(tokenize(text))
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            length = sum(terms.values())
+            self.doc_lengths[doc_id] = length
+            self.doc_terms[doc_id] = list(terms)
+            self.total_length += length
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            length = self.doc_lengths.pop(doc_id, None)
+            if length is None:
+                continue
+            self.total_length -= length
+            for term in self.doc_terms.pop(doc_id):
+                docs = self.postings[term]
+                del docs[doc_id]
+                if not docs:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Top-k (doc id, BM25 score) pairs for query, best first."""
+        n = len(self.doc_lengths)
+        if not n:
+            return []
+        average_length = self.total_length / n
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """
+    Fuse ranked lists of keys: each key scores sum(1 / (k + rank)) over the
+    lists it appears in. Ties keep the order keys were first seen in, so
+    earlier rankings win them.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs the dense retriever and a BM25 search concurrently and merges them
+    with reciprocal rank fusion, so exact identifiers found only by keyword
+    still make the top k.
+
+    With score_threshold set (normalized embeddings), keyword hits below
+    that cosine similarity to the query are dropped too, like the dense
+    side's. They are scored with embeddings, which the embedding cache
+    answers without re-encoding chunks that were indexed through it.
+    """
+
+    dense_retriever: BaseRetriever
+    sparse_index: BM25Index
+    docstore: object
+    k: int = 3
+    fetch_k: int = HYBRID_FETCH_K
+    embeddings: object = None
+    score_threshold: float = 0.0
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        dense_future = _SEARCH_EXECUTOR.submit(self.dense_retriever.invoke, query)
+        sparse_hits = self.sparse_index.search(query, self.fetch_k)
+        dense_docs = dense_future.result()
+
+        documents = {}
+        dense_ranking = []
+        for doc in dense_docs:
+            key = _document_key(doc)
+            documents.setdefault(key, doc)
+            dense_ranking.append(key)
+        sparse_ranking = []
+        for doc_id, _ in sparse_hits:
+            doc = self.docstore.search(doc_id)
+            if isinstance(doc, str):
+                # InMemoryDocstore returns an error message for unknown ids
+                continue
+            key = _document_key(doc)
+            documents.setdefault(key, doc)
+            sparse_ranking.append(key)
+        if self.score_threshold > 0:
+            sparse_ranking = self._above_threshold(query, sparse_ranking, set(dense_ranking), documents)
+
+        fused = reciprocal_rank_fusion([dense_ranking, sparse_ranking])
+        return [documents[key] for key in fused[:self.k]]
+
+    def _above_threshold(self, query: str, ranking: list, passed: set, documents: dict) -> list:
+        """The keys in ranking that are in passed or whose cosine similarity to query meets the threshold."""
+        unscored = [key for key in ranking if key not in passed]
+        if not unscored:
+            return ranking
+        query_vector = self.embeddings.embed_query(query)
+        vectors = self.embeddings.embed_documents([documents[key].page_content for key in unscored])
+        for key, vector in zip(unscored, vectors):
+            if sum(a * b for a, b in zip(query_vector, vector)) >= self.score_threshold:
+                passed.add(key)
+        return [key for key in ranking if key in passed]
+
+
+def _document_key(doc):
+    return (doc.metadata.get("source"), doc.page_content)
@@ -0,0 +1,206 @@
+# summarizers.py
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+from http_client import get_session
+
+# Tokens generated per summary
+MAX_NEW_TOKENS = 150
+
+
+def build_prompt(text: str) -> str:
+    # Create a prompt that encourages summarization
+    return f"Summarize the following text:\n\n{text}\n\nSummary:"
+
+
+class SummarizerBackend(ABC):
+    """
+    A model that turns texts into summaries.
+
+    Backends also tokenize, so map-reduce can size chunks for the model's
+    context, and report a load state for the readiness probe. summarize()
+    returns None for texts it could not summarize; those are not cached.
+    """
+
+    # Identifies the model in summary cache keys
+    name = "base"
+    # Map-reduce chunk size in this backend's tokens
+    chunk_tokens = 600
+
+    def load(self) -> bool:
+        """Prepare the backend if needed; True once it can serve requests."""
+        return True
+
+    def state(self) -> str:
+        """One of not_loaded | loading | ready | failed."""
+        return "ready"
+
+    @property
+    def error(self) -> Optional[str]:
+        return None
+
+    def reset(self):
+        """Allow another load attempt after a failure."""
+
+    @abstractmethod
+    def encode(self, text: str) -> list:
+        ...
+
+    @abstractmethod
+    def decode(self, tokens: list) -> str:
+        ...
+
+    @abstractmethod
+    def summarize(self, texts: list[str]) -> list[Optional[str]]:
+        ...
+
+
+class LocalPipelineSummarizer(SummarizerBackend):
+    """
+    A Hugging Face text-generation pipeline running in this process.
+    The model is loaded on the first load() call, behind a lock so
+    concurrent callers trigger a single load. The pipeline and its
+    tokenizer are not thread-safe, so generation and tokenization run one
+    call at a time.
+    """
+
+    def __init__(self, model_name: str = "gpt2", batch_size: int = 8, chunk_tokens: int = 600):
+        self.name = f"local:{model_name}"
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.chunk_tokens = chunk_tokens
+        self.generator = None
+        self._error = None
+        self._lock = threading.Lock()
+        # Serializes use of the loaded pipeline and tokenizer
+        self._generate_lock = threading.Lock()
+
+    def load(self) -> bool:
+        if self.generator is not None:
+            return True
+        with self._lock:
+            if self.generator is None and self._error is None:
+                try:
+                    from transformers import pipeline
+
+                    generator = pipeline("text-generation", model=self.model_name)
+                    # Batched generation needs a pad token; GPT-2 has none, and decoder-only models pad on the left
+                    generator.tokenizer.pad_token_id = generator.model.config.eos_token_id
+                    generator.tokenizer.padding_side = "left"
+                    self.generator = generator
+                    print("Text generation model loaded successfully.")
+                except Exception as e:
+                    print(f"Error loading model: {e}")
+                    self._error = str(e)
+        return self.generator is not None
+
+    def state(self) -> str:
+        if self.generator is not None:
+            return "ready"
+        if self._error is not None:
+            return "failed"
+        return "loading" if self._lock.locked() else "not_loaded"
+
+    @property
+    def error(self) -> Optional[str]:
+        return self._error
+
+    def reset(self):
+        with self._lock:
+            self._error = None
+
+    def encode(self, text: str) -> list:
+        with self._generate_lock:
+            return self.generator.tokenizer.encode(text)
+
+    def decode(self, tokens: list) -> str:
+        with self._generate_lock:
+            return self.generator.tokenizer.decode(tokens)
+
+    def summarize(self, texts: list[str]) -> list[Optional[str]]:
+        if not self.load():
+            return [None] * len(texts)
+        prompts = [build_prompt(text) for text in texts]
+        try:
+            # Generate all summaries in batched forward passes
+            with self._generate_lock:
+                results = self.generator(
+                    prompts,
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    num_return_sequences=1,
+                    do_sample=False,
+                    truncation=True,
+                    batch_size=self.batch_size,
+                )
+        except Exception as e:
+            print(f"Error during summary generation: {e}")
+            return [None] * len(texts)
+        # The generated text includes the prompt, so we extract the summary part
+        return [
+            _extract_summary(prompt, result[0]["generated_text"])
+            for prompt, result in zip(prompts, results)
+        ]
+
+
+class OpenAICompatibleSummarizer(SummarizerBackend):
+    """
+    Summarizes through an OpenAI-compatible /v1/completions endpoint, e.g.
+    the server that also answers chat. Requests go out concurrently over the
+    shared keep-alive session (http_client), so a batch of chunks costs
+    roughly one round-trip per `concurrency` texts and connections are reused.
+
+    There is no local tokenizer for the remote model, so chunk sizes are
+    measured in whitespace-delimited words.
+    """
+
+    def __init__(self, api_base: str, api_key: str, model_name: str,
+                 concurrency: int = 8, chunk_tokens: int = 1500, timeout: float = 120):
+        self.name = f"openai:{api_base}:{model_name}"
+        self.completions_url = api_base.rstrip("/") + "/completions"
+        self.api_key = api_key
+        self.model_name = model_name
+        self.chunk_tokens = chunk_tokens
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="summary-http")
+
+    def encode(self, text: str) -> list:
+        # Words with their trailing whitespace, so decode() restores the text exactly
+        return re.findall(r"\S+\s*", text)
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+    def summarize(self, texts: list[str]) -> list[Optional[str]]:
+        return list(self._executor.map(self._complete, texts))
+
+    def _complete(self, text: str) -> Optional[str]:
+        try:
+            response = get_session().post(
+                self.completions_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={
+                    "model": self.model_name,
+                    "prompt": build_prompt(text),
+                    "max_tokens": MAX_NEW_TOKENS,
+                    "temperature": 0,
+                },
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            return response.json()["choices"][0]["text"].strip()
+        except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+            print(f"Error during summary generation: {e}")
+            return None
+
+
+def _extract_summary(prompt: str, generated_text: str) -> str:
+    # Extract the summary after the "Summary:" prompt
+    if "Summary:" in generated_text:
+        return generated_text.split("Summary:")[-1].strip()
+    # Fallback: take the part after the prompt
+    return generated_text[len(prompt):].strip()
@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+def test_exact_and_near_duplicate_questions_hit():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("v1", "What is the refund policy?", [1.0, 0.0, 0.0], "30 days", ["doc"])
+
+    exact = cache.lookup("v1", [2.0, 0.0, 0.0])
+    assert exact.answer == "30 days" and exact.sources == ["doc"]
+    assert exact.similarity == pytest.approx(1.0)
+
+    near = cache.lookup("v1", [1.0, 0.2, 0.0])
+    assert near is not None and 0.95 <= near.similarity < 1.0
+
+
+def test_dissimilar_question_misses():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("v1", "refunds", [1.0, 0.0, 0.0], "30 days", [])
+    assert cache.lookup("v1", [0.7, 0.7, 0.0]) is None
+
+
+def test_other_version_misses():
+    cache = SemanticAnswerCache()
+    cache.store("v1", "refunds", [1.0, 0.0], "30 days", [])
+    assert cache.lookup("v2", [1.0, 0.0]) is None
+
+
+def test_closest_entry_wins():
+    cache = SemanticAnswerCache(threshold=0.5)
+    cache.store("v1", "a", [1.0, 0.0], "answer a", [])
+    cache.store("v1", "b", [0.8, 0.6], "answer b", [])
+    assert cache.lookup("v1", [0.7, 0.7]).answer == "answer b"
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    cache.store("v1", "refunds", [1.0, 0.0], "30 days", [])
+    now[0] += 59
+    assert cache.lookup("v1", [1.0, 0.0]) is not None
+    now[0] += 2
+    assert cache.lookup("v1", [1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store("v1", "a", [1.0, 0.0, 0.0], "answer a", [])
+    cache.store("v1", "b", [0.0, 1.0, 0.0], "answer b", [])
+    # Using a makes b the least recently used
+    assert cache.lookup("v1", [1.0, 0.0, 0.0]).answer == "answer a"
+    cache.store("v1", "c", [0.0, 0.0, 1.0], "answer c", [])
+    assert cache.lookup("v1", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("v1", [1.0, 0.0, 0.0]).answer == "answer a"
+
+
+def test_stats_count_hits_and_lookups():
+    cache = SemanticAnswerCache()
+    cache.store("v1", "a", [1.0, 0.0], "answer a", [])
+    cache.lookup("v1", [1.0, 0.0])
+    cache.lookup("v1", [0.0, 1.0])
+    assert cache.stats() == {"entries": 1, "hits": 1, "lookups": 2, "hit_rate": 0.5}
+
+
+def test_empty_answers_are_not_cached():
+    cache = SemanticAnswerCache()
+    cache.store("v1", "refunds", [1.0, 0.0], "", [])
+    cache.store("v1", "refunds", [1.0, 0.0], "  \n", [])
+    assert cache.lookup("v1", [1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
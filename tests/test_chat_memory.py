@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langchain_classic")
+
+from langchain_core.language_models.fake import FakeListLLM
+
+import chat_memory
+from chat_memory import BackgroundSummaryMemory, CachedLLMChain
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Counts one token per word and records every text counted."""
+    texts = []
+
+    def count(text):
+        texts.append(text)
+        return len(text.split())
+
+    monkeypatch.setattr(chat_memory, "get_token_counter", lambda model_name=None: count)
+    return texts
+
+
+def make_memory(max_token_limit, responses=("summary",)):
+    return BackgroundSummaryMemory(
+        llm=FakeListLLM(responses=list(responses) * 10),
+        max_token_limit=max_token_limit,
+        return_messages=True,
+    )
+
+
+def wait_for_summary(memory, timeout=5):
+    deadline = time.time() + timeout
+    while memory._summarizing and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_history_is_trimmed_to_budget_counting_each_message_once(counted, monkeypatch):
+    memory = make_memory(max_token_limit=12)
+    # Keep the background summarizer out of this test
+    monkeypatch.setattr(memory, "_schedule_summary", lambda: None)
+    for turn in range(5):
+        memory.save_context({"input": f"question {turn}"}, {"output": f"answer {turn}"})
+
+    counted.clear()
+    history = memory.load_memory_variables({})["history"]
+    # "Human: question N" and "AI: answer N" are 3 tokens each: the newest 4 fit in 12
+    assert [message.content for message in history] == ["question 3", "answer 3", "question 4", "answer 4"]
+    assert len(counted) == 10
+
+    counted.clear()
+    memory.load_memory_variables({})
+    assert counted == []
+
+
+def test_overflow_is_folded_into_the_summary(counted):
+    memory = make_memory(max_token_limit=12, responses=["they talked"])
+    for turn in range(4):
+        memory.save_context({"input": f"question {turn}"}, {"output": f"answer {turn}"})
+    wait_for_summary(memory)
+
+    # The 4 oldest messages were summarized; the summary's 2 tokens leave room for 3 of the rest
+    assert [message.content for message in memory.chat_memory.messages] == [
+        "question 2", "answer 2", "question 3", "answer 3",
+    ]
+    history = memory.load_memory_variables({})["history"]
+    assert history[0].content == "they talked"
+    assert [message.content for message in history[1:]] == ["answer 2", "question 3", "answer 3"]
+
+
+def test_clear_during_summarization_discards_the_stale_summary(counted, monkeypatch):
+    memory = make_memory(max_token_limit=6)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_summary(self, messages, existing_summary):
+        started.set()
+        release.wait(5)
+        return "old conversation"
+
+    monkeypatch.setattr(BackgroundSummaryMemory, "predict_new_summary", slow_summary)
+    for turn in range(3):
+        memory.save_context({"input": f"question {turn}"}, {"output": f"answer {turn}"})
+    assert started.wait(5)
+
+    memory.clear()
+    memory.save_context({"input": "new question"}, {"output": "new answer"})
+    release.set()
+    wait_for_summary(memory)
+
+    history = memory.load_memory_variables({})["history"]
+    assert [message.content for message in history] == ["new question", "new answer"]
+    assert memory.moving_summary_buffer == ""
+
+
+def test_question_generator_caches_only_non_empty_questions():
+    from langchain_core.prompts import PromptTemplate
+
+    chain = CachedLLMChain(
+        llm=FakeListLLM(responses=["", "standalone question", "unused"]),
+        prompt=PromptTemplate.from_template("{question}"),
+    )
+    assert chain.invoke({"question": "q"})["text"] == ""
+    assert chain.invoke({"question": "q"})["text"] == "standalone question"
+    assert chain.invoke({"question": "q"})["text"] == "standalone question"
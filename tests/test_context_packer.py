@@ -0,0 +1,117 @@
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+import context_packer
+from context_packer import pack_context
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def doc(text, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def words(start, end):
+    return " ".join(f"w{i}" for i in range(start, end))
+
+
+def test_passages_that_overflow_are_skipped_but_later_ones_still_fit():
+    documents = [doc(words(0, 6), "a.txt"), doc(words(10, 20), "b.txt"), doc(words(30, 33), "c.txt")]
+    packed = pack_context(documents, max_tokens=10, count_tokens=count_words)
+    assert [d.metadata["source"] for d in packed] == ["a.txt", "c.txt"]
+    assert sum(count_words(d.page_content) for d in packed) <= 10
+
+
+def test_adjacent_overlapping_chunks_are_merged_in_either_order():
+    # Neighbouring chunks share a splitter overlap of w5..w11
+    first, second = doc(words(0, 12)), doc(words(5, 20))
+    for documents in ([first, second], [second, first]):
+        (packed,) = pack_context(documents, max_tokens=100, count_tokens=count_words)
+        assert packed.page_content == words(0, 20)
+
+
+def test_duplicates_and_contained_chunks_are_sent_once():
+    documents = [doc(words(0, 12)), doc(words(0, 12)), doc(words(3, 9))]
+    (packed,) = pack_context(documents, max_tokens=100, count_tokens=count_words)
+    assert packed.page_content == words(0, 12)
+
+
+def test_chunks_of_different_sources_are_not_merged():
+    documents = [doc(words(0, 12), "a.txt"), doc(words(8, 20), "b.txt")]
+    packed = pack_context(documents, max_tokens=100, count_tokens=count_words)
+    assert [d.page_content for d in packed] == [words(0, 12), words(8, 20)]
+
+
+def test_short_coincidental_overlap_is_not_merged():
+    documents = [doc("alpha beta gamma"), doc("gamma delta")]
+    packed = pack_context(documents, max_tokens=100, count_tokens=count_words)
+    assert len(packed) == 2
+
+
+def test_best_passage_larger_than_budget_is_truncated():
+    documents = [doc(words(0, 50), "a.txt"), doc(words(100, 150), "b.txt")]
+    (packed,) = pack_context(documents, max_tokens=10, count_tokens=count_words)
+    assert packed.metadata["source"] == "a.txt"
+    assert 0 < count_words(packed.page_content) <= 10
+    assert words(0, 50).startswith(packed.page_content)
+
+
+def test_rank_order_is_kept_after_merging():
+    documents = [doc(words(0, 12), "a.txt"), doc(words(50, 55), "b.txt"), doc(words(5, 20), "a.txt")]
+    packed = pack_context(documents, max_tokens=100, count_tokens=count_words)
+    assert [d.metadata["source"] for d in packed] == ["a.txt", "b.txt"]
+
+
+def test_empty_input():
+    assert pack_context([], max_tokens=10, count_tokens=count_words) == []
+
+
+@pytest.fixture
+def fake_transformers(monkeypatch):
+    """A transformers module whose local cache holds tokenizers for the given names."""
+    cached = {}
+
+    class AutoTokenizer:
+        @staticmethod
+        def from_pretrained(name, local_files_only=False):
+            assert local_files_only
+            if name not in cached:
+                raise OSError(f"{name} is not in the local cache")
+            return cached[name]
+
+    class WordTokenizer:
+        def encode(self, text, add_special_tokens=True):
+            return text.split()
+
+    module = types.ModuleType("transformers")
+    module.AutoTokenizer = AutoTokenizer
+    monkeypatch.setitem(sys.modules, "transformers", module)
+    monkeypatch.setattr(context_packer, "CONTEXT_TOKENIZER", "")
+    context_packer.get_token_counter.cache_clear()
+    yield lambda name: cached.__setitem__(name, WordTokenizer())
+    context_packer.get_token_counter.cache_clear()
+
+
+def test_served_models_own_tokenizer_is_preferred(fake_transformers):
+    fake_transformers("meta-llama/Llama-3.2-1B-Instruct")
+    count = context_packer.get_token_counter("meta-llama/Llama-3.2-1B-Instruct")
+    assert count("one two three four five six seven eight") == 8
+
+
+def test_context_tokenizer_setting_wins(fake_transformers, monkeypatch):
+    fake_transformers("my/tokenizer")
+    monkeypatch.setattr(context_packer, "CONTEXT_TOKENIZER", "my/tokenizer")
+    assert context_packer.get_token_counter("unknown-model")("a b c") == 3
+
+
+def test_unknown_model_falls_back_to_an_approximation(fake_transformers, monkeypatch):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    assert context_packer.get_token_counter("unknown-model")("x" * 40) == 10
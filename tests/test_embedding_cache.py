@@ -0,0 +1,104 @@
+import itertools
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings
+
+import embedding_cache
+from embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic 4-dimensional vectors; records every text it encodes."""
+
+    def __init__(self):
+        self.encoded = []
+        self.queries = []
+
+    def _vector(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0, 0.5]
+
+    def embed_documents(self, texts):
+        self.encoded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self._vector(text)
+
+
+def make_cache(tmp_path, model_id="model", max_mb=1.0):
+    underlying = CountingEmbeddings()
+    return underlying, CachedEmbeddings(underlying, model_id, cache_dir=str(tmp_path), max_mb=max_mb)
+
+
+def test_second_embedding_of_a_chunk_is_a_cache_hit(tmp_path):
+    underlying, cache = make_cache(tmp_path)
+    first = cache.embed_documents(["alpha", "beta"])
+    second = cache.embed_documents(["beta", "gamma", "alpha"])
+
+    assert underlying.encoded == ["alpha", "beta", "gamma"]
+    assert second[0] == first[1] and second[2] == first[0]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 3)
+
+
+def test_duplicates_in_one_batch_are_encoded_once(tmp_path):
+    underlying, cache = make_cache(tmp_path)
+    vectors = cache.embed_documents(["same", "same", "other"])
+    assert underlying.encoded == ["same", "other"]
+    assert vectors[0] == vectors[1]
+
+
+def test_cache_persists_across_instances(tmp_path):
+    _, cache = make_cache(tmp_path)
+    cache.embed_documents(["alpha"])
+    underlying, reopened = make_cache(tmp_path)
+    assert reopened.embed_documents(["alpha"]) == [[5.0, float(sum(map(ord, "alpha")) % 97), 1.0, 0.5]]
+    assert underlying.encoded == []
+
+
+def test_model_id_separates_entries(tmp_path):
+    _, cache = make_cache(tmp_path, model_id="model")
+    cache.embed_documents(["alpha"])
+    underlying, quantized = make_cache(tmp_path, model_id="model:int8")
+    quantized.embed_documents(["alpha"])
+    assert underlying.encoded == ["alpha"]
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path, monkeypatch):
+    # A strictly increasing clock, so recency never ties
+    clock = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(clock)))
+    # Each vector is 16 bytes; room for 3
+    underlying, cache = make_cache(tmp_path, max_mb=48 / (1024 * 1024))
+    cache.embed_documents(["a"])
+    cache.embed_documents(["b"])
+    cache.embed_documents(["c"])
+    # Touch a so b is the least recently used
+    cache.embed_documents(["a"])
+    cache.embed_documents(["d"])
+    assert cache.stats()["entries"] == 3
+
+    underlying.encoded.clear()
+    cache.embed_documents(["a", "c", "d"])
+    assert underlying.encoded == []
+    cache.embed_documents(["b"])
+    assert underlying.encoded == ["b"]
+
+
+def test_query_vectors_are_memoized_in_memory(tmp_path):
+    underlying, cache = make_cache(tmp_path)
+    assert cache.embed_query("question") == cache.embed_query("question")
+    assert underlying.queries == ["question"]
+    assert cache.stats()["entries"] == 0
+
+
+def test_clear_drops_all_vectors(tmp_path):
+    underlying, cache = make_cache(tmp_path)
+    cache.embed_documents(["alpha"])
+    cache.clear()
+    cache.embed_documents(["alpha"])
+    assert underlying.encoded == ["alpha", "alpha"]
@@ -0,0 +1,69 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+import ingest
+
+
+class FakePool:
+    """Completes each submitted file with its parsed result, or fails the ones listed in errors."""
+
+    def __init__(self, errors=None, broken=False):
+        self.errors = errors or {}
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(self, fn, item, source, *args):
+        if self.broken:
+            raise BrokenProcessPool("pool is broken")
+        future = Future()
+        if source in self.errors:
+            future.set_exception(self.errors[source])
+        else:
+            future.set_result(fn(item, source, *args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Replaces the worker pool with FakePools handed out in order."""
+    queue = []
+    monkeypatch.setattr(ingest, "INGEST_WORKERS", 4)
+    monkeypatch.setattr(ingest, "_POOL", None)
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", lambda **kwargs: queue.pop(0))
+    return queue
+
+
+def test_worker_crash_is_reported_per_file_and_pool_replaced(pools):
+    crashed = FakePool(errors={"b.txt": BrokenProcessPool("worker died")})
+    fresh = FakePool()
+    pools.extend([crashed, fresh])
+
+    results = {result.source: result for result in ingest.ingest_files([b"alpha", b"beta"], ["a.txt", "b.txt"])}
+    assert results["a.txt"].error is None and results["a.txt"].chunks
+    assert "BrokenProcessPool" in results["b.txt"].error
+    assert crashed.shut_down
+
+    results = list(ingest.ingest_files([b"gamma", b"delta"], ["c.txt", "d.txt"]))
+    assert all(result.error is None for result in results)
+    assert ingest._POOL is fresh
+
+
+def test_broken_pool_at_submit_is_replaced(pools):
+    pools.extend([FakePool(broken=True), FakePool()])
+    results = list(ingest.ingest_files([b"alpha", b"beta"], ["a.txt", "b.txt"]))
+    assert sorted(result.source for result in results) == ["a.txt", "b.txt"]
+    assert all(result.error is None for result in results)
+
+
+def test_other_worker_errors_are_reported_per_file(pools):
+    pools.append(FakePool(errors={"a.txt": MemoryError("out of memory")}))
+    results = {result.source: result for result in ingest.ingest_files([b"alpha", b"beta"], ["a.txt", "b.txt"])}
+    assert results["a.txt"].error == "MemoryError: out of memory"
+    assert results["b.txt"].error is None
@@ -0,0 +1,269 @@
+import hashlib
+import math
+import os
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import knowledge_base
+import vector_index
+from knowledge_base import KnowledgeBase
+
+VOCABULARY = ["invoice", "payment", "refund", "overdue", "weather", "rain", "forecast", "sunny"]
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    """Unit-length word-count vectors over a fixed vocabulary."""
+
+    def _embed(self, text):
+        words = text.lower().split()
+        vector = [float(words.count(word)) for word in VOCABULARY]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class HashEmbeddings(Embeddings):
+    """A distinct pseudo-random unit vector per text."""
+
+    dim = 16
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = hashlib.sha256(text.encode("utf-8")).digest()
+        vector = [byte - 127.5 for byte in seed[:self.dim]]
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector]
+
+
+def make_knowledge_base(normalized=True, index_type="flat"):
+    return KnowledgeBase(
+        BagOfWordsEmbeddings(), "bag-of-words", normalized=normalized, index_type=index_type,
+    )
+
+
+@pytest.fixture(autouse=True)
+def signing_key(monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_KEY_FILE", str(tmp_path / "signing.key"))
+
+
+@pytest.fixture
+def dense_only(monkeypatch):
+    monkeypatch.setattr(knowledge_base, "HYBRID_SEARCH", False)
+
+
+def test_score_threshold_keeps_near_duplicates(dense_only, monkeypatch):
+    monkeypatch.setattr(knowledge_base, "RETRIEVAL_SCORE_THRESHOLD", 0.8)
+    kb = make_knowledge_base()
+    kb.add_file("billing.txt", "h1", [Document(page_content="invoice payment overdue")])
+    kb.add_file("weather.txt", "h2", [Document(page_content="weather forecast sunny")])
+    retriever = kb.as_retriever(search_kwargs={"k": 2})
+
+    results = retriever.invoke("overdue invoice payment")
+    assert [doc.metadata["source"] for doc in results] == ["billing.txt"]
+    assert retriever.invoke("rain") == []
+
+
+def test_score_threshold_applies_to_keyword_hits(monkeypatch):
+    monkeypatch.setattr(knowledge_base, "HYBRID_SEARCH", True)
+    monkeypatch.setattr(knowledge_base, "RETRIEVAL_SCORE_THRESHOLD", 0.8)
+    kb = make_knowledge_base()
+    kb.add_file("billing.txt", "h1", [Document(page_content="invoice payment overdue")])
+    kb.add_file("weather.txt", "h2", [Document(page_content="weather forecast sunny")])
+    retriever = kb.as_retriever(search_kwargs={"k": 2})
+
+    # "weather" matches weather.txt by keyword, but its cosine similarity is ~0.29
+    results = retriever.invoke("overdue invoice payment weather")
+    assert [doc.metadata["source"] for doc in results] == ["billing.txt"]
+    assert [doc.metadata["source"] for doc in retriever.invoke("weather forecast")] == ["weather.txt"]
+
+
+def test_relevance_scores_are_cosine_similarities(dense_only):
+    kb = make_knowledge_base()
+    kb.add_file("billing.txt", "h1", [Document(page_content="invoice payment")])
+    ((_, exact),) = kb.vectorstore.similarity_search_with_relevance_scores("invoice payment", k=1)
+    ((_, half),) = kb.vectorstore.similarity_search_with_relevance_scores("invoice", k=1)
+    assert exact == pytest.approx(1.0, abs=1e-5)
+    assert half == pytest.approx(1 / math.sqrt(2), abs=1e-5)
+
+
+def test_reloaded_knowledge_base_keeps_cosine_scores(dense_only, monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_DIR", str(tmp_path))
+    kb = make_knowledge_base()
+    kb.name = "billing"
+    kb.add_file("billing.txt", "h1", [Document(page_content="invoice payment")])
+    kb.save()
+
+    reloaded = KnowledgeBase.load("billing", BagOfWordsEmbeddings(), "bag-of-words", normalized=True)
+    ((_, score),) = reloaded.vectorstore.similarity_search_with_relevance_scores("invoice payment", k=1)
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8", "hnsw", "ivf", "ivfpq"])
+def test_remove_then_add_keeps_ids_aligned(dense_only, monkeypatch, index_type):
+    # Let the trained index types train on a test-sized corpus, and probe every list
+    monkeypatch.setattr(vector_index, "_MIN_POINTS_PER_CENTROID", 1)
+    monkeypatch.setattr(vector_index, "IVF_NPROBE", 256)
+    if index_type == "ivfpq":
+        monkeypatch.setattr(vector_index, "_pq_subquantizers", lambda dim: 4)
+        monkeypatch.setattr(vector_index, "_ivf_nlist", lambda n: 4)
+
+    kb = KnowledgeBase(HashEmbeddings(), "hash", normalized=True, index_type=index_type)
+    for name in ("a", "b", "c"):
+        texts = [f"{name} chunk {i}" for i in range(120)]
+        kb.add_file(f"{name}.txt", name, [Document(page_content=text) for text in texts])
+    assert kb.current_index_type == index_type
+
+    kb.remove_file("a.txt")
+    kb.add_file("d.txt", "d", [Document(page_content=f"d chunk {i}") for i in range(120)])
+    assert kb.vectorstore.index.ntotal == kb.chunk_count == 360
+
+    for text in ("b chunk 7", "c chunk 119", "d chunk 0", "d chunk 64"):
+        (doc,) = kb.vectorstore.similarity_search(text, k=1)
+        assert doc.page_content == text
+    assert "a.txt" not in {
+        doc.metadata["source"] for doc in kb.vectorstore.similarity_search("a chunk 3", k=20)
+    }
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "ivfpq"])
+def test_remove_keeps_the_trained_ivf_index(dense_only, monkeypatch, index_type):
+    monkeypatch.setattr(vector_index, "_MIN_POINTS_PER_CENTROID", 1)
+    monkeypatch.setattr(vector_index, "IVF_NPROBE", 256)
+    monkeypatch.setattr(vector_index, "_pq_subquantizers", lambda dim: 4)
+    monkeypatch.setattr(vector_index, "_ivf_nlist", lambda n: 4)
+    faiss = pytest.importorskip("faiss")
+
+    kb = KnowledgeBase(HashEmbeddings(), "hash", normalized=True, index_type=index_type)
+    for name in ("a", "b", "c", "d"):
+        kb.add_file(f"{name}.txt", name, [Document(page_content=f"{name} chunk {i}") for i in range(120)])
+    ivf = faiss.extract_index_ivf(kb.vectorstore.index)
+    centroids = faiss.vector_to_array(faiss.downcast_index(ivf.quantizer).codes).copy()
+
+    def no_retraining(*args, **kwargs):
+        raise AssertionError("removal retrained the index")
+
+    monkeypatch.setattr(vector_index, "build_index", no_retraining)
+    kb.remove_file("b.txt")
+    assert kb.current_index_type == index_type
+    assert kb.vectorstore.index.ntotal == kb.chunk_count == 360
+    ivf = faiss.extract_index_ivf(kb.vectorstore.index)
+    assert (faiss.vector_to_array(faiss.downcast_index(ivf.quantizer).codes) == centroids).all()
+    (doc,) = kb.vectorstore.similarity_search("c chunk 5", k=1)
+    assert doc.page_content == "c chunk 5"
+
+
+def test_save_switches_versions_atomically(monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_DIR", str(tmp_path))
+    kb = KnowledgeBase(HashEmbeddings(), "hash", name="docs")
+    kb.add_file("a.txt", "a", [Document(page_content="a chunk")])
+    kb.save()
+    first = knowledge_base.read_manifest(str(tmp_path / "docs"))["data_dir"]
+    kb.add_file("b.txt", "b", [Document(page_content="b chunk")])
+    kb.save()
+    second = knowledge_base.read_manifest(str(tmp_path / "docs"))["data_dir"]
+    kb.add_file("c.txt", "c", [Document(page_content="c chunk")])
+    kb.save()
+    third = knowledge_base.read_manifest(str(tmp_path / "docs"))["data_dir"]
+
+    # The current version and the one it replaced are kept; older ones are pruned
+    versions = {os.path.join("versions", path.name) for path in (tmp_path / "docs" / "versions").iterdir()}
+    assert versions == {second, third}
+    assert first not in versions
+
+    reloaded = KnowledgeBase.load("docs", HashEmbeddings(), "hash")
+    assert sorted(reloaded.files) == ["a.txt", "b.txt", "c.txt"]
+    assert reloaded.vectorstore.index.ntotal == 3
+
+
+def test_save_over_a_newer_version_is_refused(monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_DIR", str(tmp_path))
+    kb = KnowledgeBase(HashEmbeddings(), "hash", name="docs")
+    kb.add_file("a.txt", "a", [Document(page_content="a chunk")])
+    kb.save()
+
+    # Two writers (e.g. the app and the API process) load the same version
+    first = KnowledgeBase.load("docs", HashEmbeddings(), "hash")
+    second = KnowledgeBase.load("docs", HashEmbeddings(), "hash")
+    first.add_file("b.txt", "b", [Document(page_content="b chunk")])
+    first.save()
+    second.add_file("c.txt", "c", [Document(page_content="c chunk")])
+    with pytest.raises(knowledge_base.StaleKnowledgeBaseError):
+        second.save()
+    assert sorted(KnowledgeBase.load("docs", HashEmbeddings(), "hash").files) == ["a.txt", "b.txt"]
+
+
+def test_open_knowledge_base_shares_one_instance(monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_DIR", str(tmp_path))
+    first, first_lock = knowledge_base.open_knowledge_base("shared", HashEmbeddings(), "hash")
+    second, second_lock = knowledge_base.open_knowledge_base("shared", HashEmbeddings(), "hash")
+    assert first is second and first_lock is second_lock
+
+    first.add_file("a.txt", "a", [Document(page_content="a chunk")])
+    first.save()
+    second.add_file("b.txt", "b", [Document(page_content="b chunk")])
+    second.save()
+    assert sorted(KnowledgeBase.load("shared", HashEmbeddings(), "hash").files) == ["a.txt", "b.txt"]
+
+    KnowledgeBase.delete("shared")
+    reopened, _ = knowledge_base.open_knowledge_base("shared", HashEmbeddings(), "hash")
+    assert reopened is not first and not reopened.files
+
+
+def test_load_rejects_a_different_embedding_precision(monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_DIR", str(tmp_path))
+    kb = KnowledgeBase(HashEmbeddings(), "hash", name="docs", precision="int8")
+    kb.add_file("a.txt", "a", [Document(page_content="a chunk")])
+    kb.save()
+
+    assert KnowledgeBase.load("docs", HashEmbeddings(), "hash", precision="int8").precision == "int8"
+    with pytest.raises(ValueError, match="int8"):
+        KnowledgeBase.load("docs", HashEmbeddings(), "hash")
+
+
+def test_add_file_with_precomputed_vectors(dense_only):
+    kb = make_knowledge_base()
+    chunks = [Document(page_content="invoice payment"), Document(page_content="weather forecast")]
+    vectors = kb.embed_chunks(chunks)
+    assert kb.add_file("mixed.txt", "h1", chunks, vectors) == 2
+    (doc,) = kb.vectorstore.similarity_search("forecast weather", k=1)
+    assert doc.page_content == "weather forecast"
+    assert doc.metadata["source"] == "mixed.txt"
+
+
+def test_set_embeddings_switches_the_query_model(dense_only):
+    kb = make_knowledge_base()
+    kb.add_file("billing.txt", "h1", [Document(page_content="invoice payment")])
+    reloaded = BagOfWordsEmbeddings()
+    kb.set_embeddings(reloaded)
+    assert kb.embeddings is reloaded and kb.vectorstore.embedding_function is reloaded
+    (doc,) = kb.as_retriever(search_kwargs={"k": 1}).invoke("invoice")
+    assert doc.metadata["source"] == "billing.txt"
+
+
+def test_load_refuses_pickles_it_did_not_sign(monkeypatch, tmp_path):
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_DIR", str(tmp_path / "kbs"))
+    kb = KnowledgeBase(HashEmbeddings(), "hash", name="docs")
+    kb.add_file("a.txt", "a", [Document(page_content="a chunk")])
+    kb.save()
+    assert KnowledgeBase.load("docs", HashEmbeddings(), "hash").files
+
+    # The same files signed by another installation's key
+    monkeypatch.setattr(knowledge_base, "KNOWLEDGE_BASE_KEY_FILE", str(tmp_path / "other.key"))
+    with pytest.raises(ValueError, match="KNOWLEDGE_BASE_ALLOW_UNSIGNED"):
+        KnowledgeBase.load("docs", HashEmbeddings(), "hash")
+    with pytest.raises(ValueError, match="KNOWLEDGE_BASE_ALLOW_UNSIGNED"):
+        knowledge_base.open_knowledge_base("docs", HashEmbeddings(), "hash")
+    assert KnowledgeBase.load("docs", HashEmbeddings(), "hash", allow_unsigned=True).files
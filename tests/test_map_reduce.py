@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("docx")
+pytest.importorskip("reportlab")
+
+import mcp_main
+from mcp_main import split_into_chunks
+from summarizers import OpenAICompatibleSummarizer
+
+
+@pytest.fixture(autouse=True)
+def word_backend(monkeypatch):
+    """A backend whose tokens are words, so sizes are easy to reason about."""
+    backend = OpenAICompatibleSummarizer("http://localhost:1/v1", "", "test", concurrency=1, chunk_tokens=40)
+    monkeypatch.setattr(mcp_main, "backend", backend)
+    return backend
+
+
+def paragraphs(count, words=8, tag="p"):
+    return [" ".join(f"{tag}{i}w{j}" for j in range(words)) for i in range(count)]
+
+
+def test_chunks_respect_the_token_budget_and_keep_every_paragraph():
+    parts = paragraphs(50)
+    chunks = split_into_chunks("\n\n".join(parts), max_tokens=40)
+    assert all(len(chunk.split()) <= 40 for chunk in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(parts)
+
+
+def test_default_budget_is_the_backends_chunk_size():
+    chunks = split_into_chunks("\n\n".join(paragraphs(50)))
+    assert all(len(chunk.split()) <= 40 for chunk in chunks)
+    assert len(chunks) > 1
+
+
+def test_oversized_paragraph_is_split_on_token_boundaries():
+    long_paragraph = " ".join(f"w{i}" for i in range(100))
+    chunks = split_into_chunks(long_paragraph, max_tokens=30)
+    assert [len(chunk.split()) for chunk in chunks] == [30, 30, 30, 10]
+    assert " ".join(chunk.strip() for chunk in chunks) == long_paragraph
+
+
+def test_an_edit_only_changes_the_chunks_around_it():
+    parts = paragraphs(80)
+    before = split_into_chunks("\n\n".join(parts), max_tokens=40)
+    parts[40] = "an edited paragraph"
+    after = split_into_chunks("\n\n".join(parts), max_tokens=40)
+    changed = set(after) - set(before)
+    assert 1 <= len(changed) <= 3
+    assert len(set(after) & set(before)) >= len(before) - 3
+
+
+def test_blank_text_has_no_chunks():
+    assert split_into_chunks("\n\n  \n\n", max_tokens=40) == []
@@ -150,13 +150,14 @@ def test_mcp():
     """Test that MCP module can be imported and summarizer loaded."""
     print("\nTesting MCP module...")
     try:
-        from mcp_main import app, summarizer
+        from mcp_main import app, backend
         print("✓ MCP module imported successfully")
     except ImportError as e:
         print(f"✗ Failed to import MCP module: {e}")
         return False
     
-    if summarizer is not None:
+    # The model is loaded lazily, on first use
+    if backend.load():
         print("✓ MCP summarizer loaded successfully")
     else:
         print("⚠ MCP summarizer is None (model might have failed to load - check internet connection or HF hub)")
@@ -0,0 +1,56 @@
+import types
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("langchain_community")
+
+from fastapi.testclient import TestClient
+
+import rag_api
+from answer_cache import SemanticAnswerCache
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The API over a stub knowledge base, with a fresh answer cache; set_tokens() picks the LLM output."""
+    cache = SemanticAnswerCache()
+    embeddings = types.SimpleNamespace(embed_query=lambda text: [1.0, 0.0])
+    stream = {}
+    monkeypatch.setattr(rag_api, "_check_name", lambda name, must_exist=True: None)
+    monkeypatch.setattr(rag_api, "_version", lambda name: (types.SimpleNamespace(embeddings=embeddings), "v1"))
+    monkeypatch.setattr(rag_api, "get_llm", lambda: types.SimpleNamespace(model_name="m"))
+    monkeypatch.setattr(rag_api, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(rag_api, "_retrieve", lambda name, request, llm=None: ([], stream["tokens"](), None))
+    client = TestClient(rag_api.app, raise_server_exceptions=False)
+    return client, cache, lambda tokens: stream.update(tokens=tokens)
+
+
+def failing_stream():
+    yield "partial "
+    raise ConnectionError("LLM went away")
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_generation_is_not_cached(api, stream):
+    client, cache, set_tokens = api
+    set_tokens(failing_stream)
+    try:
+        client.post("/kb/docs/answer", json={"question": "refunds?", "stream": stream})
+    except ConnectionError:
+        # The streamed response fails while it is being read
+        pass
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_only_non_empty_answers_are_cached(api, stream):
+    client, cache, set_tokens = api
+    set_tokens(lambda: iter([]))
+    client.post("/kb/docs/answer", json={"question": "refunds?", "stream": stream})
+    assert cache.stats()["entries"] == 0
+
+    set_tokens(lambda: iter(["30 ", "days"]))
+    client.post("/kb/docs/answer", json={"question": "refunds?", "stream": stream})
+    assert cache.lookup("v1:m:3", [1.0, 0.0]).answer == "30 days"
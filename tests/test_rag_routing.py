@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("langchain_classic")
+
+from rag import mentions_source
+
+SOURCES = ["annual_report-2023.pdf", "pricing.xlsx", "v2.txt"]
+
+
+@pytest.mark.parametrize("query", [
+    "What does annual_report-2023.pdf say about revenue?",
+    "Summarize notes.docx",
+    "what is in the annual report 2023",
+    "Revenue in ANNUAL_REPORT-2023?",
+    "which plans are listed in pricing",
+])
+def test_questions_naming_a_file_need_the_self_query_call(query):
+    assert mentions_source(query, SOURCES)
+
+
+@pytest.mark.parametrize("query", [
+    "What was revenue last year?",
+    "Is there a v2 of the API?",
+    "How are prices calculated?",
+    "Explain the pricingmodel",
+])
+def test_other_questions_skip_it(query):
+    assert not mentions_source(query, SOURCES)
+
+
+def test_no_sources():
+    assert not mentions_source("what is the annual report about", [])
@@ -0,0 +1,89 @@
+import pickle
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from sparse_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def make_index():
+    index = BM25Index()
+    index.add(
+        ["invoice", "error", "weather"],
+        [
+            "Invoice 1042 is overdue; payment reminder sent.",
+            "Pump fails with error code E-1042 after the firmware update.",
+            "Sunny weather expected, no rain in the forecast.",
+        ],
+    )
+    return index
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Error E-1042 in v2.3") == ["error", "e-1042", "e", "1042", "in", "v2.3", "v2", "3"]
+
+
+def test_exact_identifier_ranks_first():
+    index = make_index()
+    hits = index.search("E-1042", k=3)
+    assert [doc_id for doc_id, _ in hits] == ["error", "invoice"]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_more_matching_terms_rank_higher():
+    hits = make_index().search("overdue invoice payment", k=3)
+    assert hits[0][0] == "invoice"
+    assert "weather" not in {doc_id for doc_id, _ in hits}
+
+
+def test_remove_drops_only_that_documents_postings():
+    index = make_index()
+    index.remove(["invoice", "unknown"])
+    assert len(index) == 2
+    assert "overdue" not in index.postings
+    assert set(index.postings["1042"]) == {"error"}
+    assert index.total_length == sum(index.doc_lengths.values())
+    assert [doc_id for doc_id, _ in index.search("1042 invoice", k=3)] == ["error"]
+
+
+def test_remove_then_add_again():
+    index = make_index()
+    index.remove(["weather"])
+    index.add(["weather"], ["Heavy rain tomorrow"])
+    assert [doc_id for doc_id, _ in index.search("rain", k=3)] == ["weather"]
+    assert index.search("sunny", k=3) == []
+
+
+def test_re_adding_a_doc_id_replaces_it():
+    index = make_index()
+    length = index.total_length
+    index.add(["weather"], ["Sunny weather expected, no rain in the forecast."])
+    assert index.total_length == length
+    assert index.postings["sunny"] == {"weather": 1}
+
+
+def test_index_pickled_without_doc_terms_still_removes():
+    index = make_index()
+    state = dict(index.__dict__)
+    del state["doc_terms"]
+    old = BM25Index.__new__(BM25Index)
+    old.__setstate__(pickle.loads(pickle.dumps(state)))
+    old.remove(["error"])
+    assert "e-1042" not in old.postings
+
+
+def test_search_on_empty_index():
+    assert BM25Index().search("anything", k=3) == []
+
+
+def test_rrf_rewards_keys_in_both_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+    assert fused[0] == "c"
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_rrf_ties_keep_first_seen_order():
+    # a and x are both first in one list, b and y both second: equal scores
+    assert reciprocal_rank_fusion([["a", "b"], ["x", "y"]], k=60) == ["a", "x", "b", "y"]
+    assert reciprocal_rank_fusion([["x", "y"], ["a", "b"]], k=60) == ["x", "a", "y", "b"]
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_community")
+
+import vector_index
+from vector_index import resolve_index_type
+
+
+@pytest.mark.parametrize("n, expected", [
+    (0, "flat"),
+    (49_999, "flat"),
+    (50_000, "hnsw"),
+    (999_999, "hnsw"),
+    (1_000_000, "ivfpq"),
+])
+def test_auto_picks_by_corpus_size(n, expected):
+    assert resolve_index_type("auto", n) == expected
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8", "hnsw"])
+def test_untrained_types_are_kept_at_any_size(index_type):
+    assert resolve_index_type(index_type, 1) == index_type
+    assert resolve_index_type(index_type, 2_000_000) == index_type
+
+
+def test_ivf_falls_back_to_flat_without_enough_training_data():
+    # ~4*sqrt(n) lists need ~39 points each
+    assert resolve_index_type("ivf", 1_000) == "flat"
+    assert resolve_index_type("ivf", 30_000) == "ivf"
+
+
+def test_ivfpq_falls_back_to_flat_or_hnsw(monkeypatch):
+    assert resolve_index_type("ivfpq", 10_000) == "flat"
+    assert resolve_index_type("ivfpq", 100_000) == "ivfpq"
+    monkeypatch.setattr(vector_index, "AUTO_HNSW_MIN_VECTORS", 5_000)
+    assert resolve_index_type("ivfpq", 10_000) == "hnsw"
+
+
+def test_unknown_type_is_rejected():
+    with pytest.raises(ValueError, match="Unknown index type"):
+        resolve_index_type("annoy", 10)
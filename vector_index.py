@@ -0,0 +1,234 @@
+# vector_index.py
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+# Index type: auto | flat | sq8 | hnsw | ivf | ivfpq
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+
+# Recall/latency knobs for approximate indexes
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Corpus sizes (in chunks) at which INDEX_TYPE=auto switches index type
+AUTO_HNSW_MIN_VECTORS = int(os.getenv("AUTO_HNSW_MIN_VECTORS", "50000"))
+AUTO_IVFPQ_MIN_VECTORS = int(os.getenv("AUTO_IVFPQ_MIN_VECTORS", "1000000"))
+
+INDEX_TYPES = ("flat", "sq8", "hnsw", "ivf", "ivfpq")
+
+# FAISS k-means wants roughly this many training points per centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def _ivf_nlist(n: int) -> int:
+    return max(1, min(65536, int(4 * math.sqrt(n))))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest sub-quantizer count giving at least 4 dims per sub-vector."""
+    for m in range(dim // 4, 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def resolve_index_type(requested: str, n: int) -> str:
+    """
+    The index type that will actually be built for n vectors: 'auto' picks by
+    corpus size, and trained types fall back when there is too little data
+    to train them.
+    """
+    if requested == "auto":
+        if n >= AUTO_IVFPQ_MIN_VECTORS:
+            requested = "ivfpq"
+        elif n >= AUTO_HNSW_MIN_VECTORS:
+            requested = "hnsw"
+        else:
+            requested = "flat"
+    if requested not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{requested}'. Use auto or one of {INDEX_TYPES}.")
+
+    if requested == "ivf" and n < _ivf_nlist(n) * _MIN_POINTS_PER_CENTROID:
+        return "flat"
+    if requested == "ivfpq" and n < max(_ivf_nlist(n), 256) * _MIN_POINTS_PER_CENTROID:
+        return "hnsw" if n >= AUTO_HNSW_MIN_VECTORS else "flat"
+    return requested
+
+
+def index_type_of(index) -> str:
+    """Name of a FAISS index's type, as used by INDEX_TYPE."""
+    faiss = dependable_faiss_import()
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def build_index(index_type: str, vectors: np.ndarray, inner_product: bool):
+    """Create, train and fill a FAISS index of the given type."""
+    faiss = dependable_faiss_import()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    metric = faiss.METRIC_INNER_PRODUCT if inner_product else faiss.METRIC_L2
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim) if inner_product else faiss.IndexFlatL2(dim)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dim) if inner_product else faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, _ivf_nlist(n), metric)
+    elif index_type == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dim) if inner_product else faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, _ivf_nlist(n), _pq_subquantizers(dim), 8, metric)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'.")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    set_search_params(index)
+    return index
+
+
+def refill_index(index, vectors: np.ndarray):
+    """
+    A copy of a trained index holding only vectors: keeps the IVF centroids
+    and PQ codebooks instead of retraining them, so the cost is encoding the
+    vectors, not k-means over the corpus.
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.clone_index(index)
+    index.reset()
+    if len(vectors):
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    set_search_params(index)
+    return index
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Apply the nprobe / efSearch recall-latency knobs to an index."""
+    faiss = dependable_faiss_import()
+    index_type = index_type_of(index)
+    if index_type in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = nprobe or IVF_NPROBE
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+
+
+def reconstruct_vectors(index, positions=None) -> np.ndarray:
+    """
+    Read vectors back out of an index (exact for flat/HNSW, approximate for
+    quantized types), optionally only those at the given positions.
+    """
+    faiss = dependable_faiss_import()
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if index_type_of(index) in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    if positions is not None:
+        vectors = vectors[np.asarray(positions, dtype=np.int64)]
+    return vectors
+
+
+def benchmark_recall(index, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                     inner_product: bool = False) -> dict:
+    """
+    Recall@k of index against an exact flat search over the same vectors,
+    plus mean per-query latency of both.
+    """
+    exact = build_index("flat", vectors, inner_product)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    start = time.perf_counter()
+    _, exact_ids = exact.search(queries, k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    _, approx_ids = index.search(queries, k)
+    approx_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    hits = 0
+    expected = 0
+    for approx_row, exact_row in zip(approx_ids, exact_ids):
+        exact_set = set(exact_row[exact_row >= 0])
+        hits += len(set(approx_row[approx_row >= 0]) & exact_set)
+        expected += len(exact_set)
+    return {
+        "index_type": index_type_of(index),
+        "vectors": len(vectors),
+        "queries": len(queries),
+        "k": k,
+        "recall_at_k": hits / expected if expected else 1.0,
+        "flat_ms_per_query": flat_ms,
+        "index_ms_per_query": approx_ms,
+    }
+
+
+def main():
+    """
+    Benchmark approximate index types against the flat baseline on a saved
+    knowledge base. Queries are chunk vectors held out of the benchmarked
+    indexes, so no query finds itself; real questions are usually further
+    from the corpus than chunks are, so recall on them can be lower.
+    """
+    from knowledge_base import INDEX_FILE, data_directory, knowledge_base_path, read_manifest
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("knowledge_base", help="Name of a saved knowledge base")
+    parser.add_argument("--index-types", default="sq8,hnsw,ivf,ivfpq")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    args = parser.parse_args()
+
+    faiss = dependable_faiss_import()
+    directory = knowledge_base_path(args.knowledge_base)
+    manifest = read_manifest(directory)
+    if manifest is None or not os.path.exists(os.path.join(data_directory(directory, manifest), INDEX_FILE)):
+        parser.error(f"Knowledge base '{args.knowledge_base}' not found or empty.")
+
+    inner_product = manifest.get("normalized", False)
+    vectors = reconstruct_vectors(faiss.read_index(os.path.join(data_directory(directory, manifest), INDEX_FILE)))
+    # Hold the query vectors out of the index: a query that is itself indexed is its own
+    # nearest neighbour, which inflates recall, most of all for IVF/PQ
+    rng = np.random.default_rng(0)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rng.choice(len(vectors), size=min(args.queries, len(vectors) // 2), replace=False)] = True
+    queries = vectors[held_out]
+    vectors = vectors[~held_out]
+
+    print(f"{len(vectors)} vectors, {len(queries)} held-out chunk vectors as queries, k={args.k}")
+    for requested in args.index_types.split(","):
+        index_type = resolve_index_type(requested.strip(), len(vectors))
+        start = time.perf_counter()
+        index = build_index(index_type, vectors, inner_product)
+        build_seconds = time.perf_counter() - start
+        set_search_params(index, args.nprobe, args.ef_search)
+        result = benchmark_recall(index, vectors, queries, args.k, inner_product)
+        print(
+            f"{requested:>6} -> {result['index_type']:<6} "
+            f"recall@{args.k}={result['recall_at_k']:.3f}  "
+            f"{result['index_ms_per_query']:.3f} ms/query (flat {result['flat_ms_per_query']:.3f})  "
+            f"build {build_seconds:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()